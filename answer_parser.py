@@ -0,0 +1,113 @@
+import re
+
+import numpy as np
+import pandas as pd
+
+from label_scoring import DATASET_LABELS
+
+# Label given to answers no rule can map to a class (including "openai error")
+UNPARSEABLE = -1
+
+# Regexes (case-insensitive) for the words a model uses to name each depression
+# severity level, per language. They cover the inflected forms seen in the
+# outputs and avoid look-alike words for "severity" or "difficulty" (e.g.
+# σοβαρότητα, Schweregrad/die Schwere der, vaikeusaste/vaikeuksia, şiddet, gravité).
+DEPRESSION_LABEL_WORDS = {
+    'english': [r'minim(?:um|al)', r'mild', r'moderate', r'severe'],
+    'turkish': [r'minimum', r'hafif', r'orta', r'şiddetli'],
+    'portuguese': [r'm[íi]nim[oa]', r'leve', r'moderad[oa]', r'grave'],
+    'german': [r'minimal\w*', r'leicht\w*', r'mittelschwer\w*', r'schwer(?!egrad|e\s+de[rs]\b)\w*'],
+    'finnish': [r'minimi\w*', r'liev\w*', r'kohtalai\w*', r'vaike(?!u)\w*'],
+    'greek': [r'ελάχιστ[οηα]', r'ήπι[οα]', r'μέτρι[οα]', r'σοβαρ(?:ό|ή|ά|ός|ής)'],
+    'french': [r'minim(?:al|ale|um)', r'l[ée]g[eè]re?', r'mod[ée]r[ée]e?', r's[ée]v[èe]re|grave'],
+}
+
+LINE_RE = r'^\s*(-?\d+):\s?(.*)$'
+
+
+def _digit(label):
+    # The digit on its own, not part of a number, a decimal or a percentage
+    return rf'(?<![\w.,/]){label}(?![\w%/]|[.,]\d)'
+
+
+class _Rules:
+    """Precompiled regexes for one (dataset, language) pair."""
+
+    def __init__(self, dataset, language):
+        self.labels = DATASET_LABELS[dataset]
+        digits = ''.join(str(label) for label in self.labels)
+        self.bare = re.compile(rf'^\W*([{digits}])\W*$')
+        self.digit = [re.compile(_digit(label)) for label in self.labels]
+        words = DEPRESSION_LABEL_WORDS.get(language) if dataset == 'depression_reddit' else None
+        self.word = []
+        self.digit_word = []
+        if words:
+            for label, word in zip(self.labels, words):
+                word = rf'(?<!\w)(?:{word})(?!\w)'
+                self.word.append(re.compile(word, re.IGNORECASE))
+                # "2: Moderate", "1 (léger)", "Μέτριο (2)"
+                self.digit_word.append(re.compile(
+                    rf'{_digit(label)}\s*[:.)=\-–]?\s*\(?\s*{word}|{word}\W{{0,3}}\(\s*{label}\s*\)', re.IGNORECASE))
+
+
+_RULES = {}
+
+
+def rules_for(dataset, language):
+    key = (dataset, language)
+    if key not in _RULES:
+        _RULES[key] = _Rules(dataset, language)
+    return _RULES[key]
+
+
+def _unique_match(answers, patterns, labels):
+    # One boolean column per label; rows where exactly one label matches get it
+    if not patterns:
+        return pd.Series(UNPARSEABLE, index=answers.index)
+    hits = np.column_stack([answers.str.contains(pattern).to_numpy(dtype=bool) for pattern in patterns])
+    unique = hits.sum(axis=1) == 1
+    return pd.Series(np.where(unique, np.asarray(labels)[hits.argmax(axis=1)], UNPARSEABLE), index=answers.index)
+
+
+def parse_answers(answers, dataset, language):
+    """Map raw prediction texts (a Series) to integer labels, UNPARSEABLE where no rule applies.
+
+    Rules are tried in order of confidence and each only fills rows the
+    previous ones left open: a bare digit, a digit next to its label word, a
+    single distinct label digit anywhere in the answer, a single distinct
+    label word.
+    """
+    rules = rules_for(dataset, language)
+    answers = answers.fillna('').astype(str)
+    parsed = answers.str.extract(rules.bare, expand=False).astype(float).fillna(UNPARSEABLE).astype(int)
+    for patterns in (rules.digit_word, rules.digit, rules.word):
+        todo = parsed == UNPARSEABLE
+        if not todo.any():
+            break
+        parsed[todo] = _unique_match(answers[todo], patterns, rules.labels)
+    return parsed
+
+
+def read_predictions(path):
+    """Read an "index: text" results file into a Series of texts indexed by row index.
+
+    If a row appears more than once (resumed or repaired runs) the last line wins.
+    """
+    with open(path, encoding='utf-8') as f:
+        # split('\n') like load_checkpoint(): splitlines() also breaks on \x85, \u2028, ...
+        lines = pd.Series(f.read().split('\n'), dtype=object)
+    fields = lines.str.extract(LINE_RE).dropna(subset=[0])
+    answers = pd.Series(fields[1].to_numpy(), index=fields[0].astype(int).to_numpy())
+    return answers[~answers.index.duplicated(keep='last')]
+
+
+def parse_file(path, dataset, language, index=None):
+    """Parse a predictions file; with index given, rows missing from the file are UNPARSEABLE."""
+    answers = read_predictions(path)
+    if index is not None:
+        answers = answers.reindex(index)
+    return parse_answers(answers, dataset, language)
+
+
+def unparseable_counts(parsed):
+    return int((parsed == UNPARSEABLE).sum()), len(parsed)
@@ -0,0 +1,201 @@
+import hashlib
+import io
+import json
+import os
+import time
+import uuid
+from types import SimpleNamespace
+
+# OpenAI Batch API limits are 50,000 requests and 200 MB per input file; stay a bit below
+MAX_BATCH_REQUESTS = 50000
+MAX_BATCH_BYTES = 190 * 1024 * 1024
+ENDPOINT = "/v1/chat/completions"
+FINAL_STATUSES = ("completed", "failed", "expired", "cancelled")
+
+
+def write_batch_files(requests, path_prefix, max_requests=MAX_BATCH_REQUESTS, max_bytes=MAX_BATCH_BYTES):
+    """Write {custom_id: request body} as JSONL batch input files, split to respect the limits."""
+    paths = []
+    f = None
+    count = size = 0
+    for custom_id, body in requests.items():
+        line = json.dumps({"custom_id": custom_id, "method": "POST", "url": ENDPOINT, "body": body},
+                          ensure_ascii=False) + "\n"
+        data = line.encode("utf-8")
+        if f is None or count >= max_requests or size + len(data) > max_bytes:
+            if f is not None:
+                f.close()
+            paths.append(path_prefix + "_" + str(len(paths)) + ".jsonl")
+            f = open(paths[-1], "wb")
+            count = size = 0
+        f.write(data)
+        count += 1
+        size += len(data)
+    if f is not None:
+        f.close()
+    return paths
+
+
+def parse_batch_output(text):
+    """Map custom_id to the first choice (as a dict, plus "usage") of every successful line of a batch output file."""
+    outputs = {}
+    for line in text.splitlines():
+        if not line.strip():
+            continue
+        record = json.loads(line)
+        response = record.get("response") or {}
+        if record.get("error") or response.get("status_code") != 200:
+            continue
+        # Usage is per response, keep it with the choice so callers see both
+        outputs[record["custom_id"]] = dict(response["body"]["choices"][0], usage=response["body"].get("usage"))
+    return outputs
+
+
+def _file_digest(path):
+    with open(path, "rb") as f:
+        return hashlib.sha256(f.read()).hexdigest()
+
+
+def load_submitted(path):
+    """{input file sha256: batch id} of the batches recorded in path; empty if there is none."""
+    if not os.path.exists(path):
+        return {}
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)
+
+
+def save_submitted(path, submitted):
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(submitted, f, indent=2)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+
+def _reusable(client, batch_id):
+    # A batch that failed validation or was cancelled has nothing to wait for
+    try:
+        return client.batches.retrieve(batch_id).status not in ("failed", "cancelled")
+    except Exception:
+        return False
+
+
+def run_batches(client, requests, path_prefix, poll_interval=30.0):
+    """Submit requests through the Batch API, wait for every batch and return {custom_id: choice}.
+
+    Submitted batch ids are recorded in path_prefix + "_batches.json" under the
+    hash of their input file, so a rerun after a crash re-attaches to those
+    batches instead of paying for the same requests again. Requests that
+    failed or never ran are missing from the result.
+    """
+    if not requests:
+        return {}
+    manifest_path = path_prefix + "_batches.json"
+    submitted = load_submitted(manifest_path)
+    pending = []
+    for path in write_batch_files(requests, path_prefix):
+        digest = _file_digest(path)
+        batch_id = submitted.get(digest)
+        if batch_id is not None and _reusable(client, batch_id):
+            print("Re-attaching to batch", batch_id, "for", path)
+        else:
+            with open(path, "rb") as f:
+                input_file = client.files.create(file=f, purpose="batch")
+            batch_id = client.batches.create(input_file_id=input_file.id, endpoint=ENDPOINT,
+                                             completion_window="24h").id
+            submitted[digest] = batch_id
+            save_submitted(manifest_path, submitted)
+            print("Submitted batch", batch_id, "from", path)
+        pending.append(batch_id)
+
+    outputs = {}
+    while pending:
+        still_pending = []
+        for batch_id in pending:
+            batch = client.batches.retrieve(batch_id)
+            if batch.status not in FINAL_STATUSES:
+                still_pending.append(batch_id)
+                continue
+            print("Batch", batch_id, batch.status)
+            # Failed or expired batches can still carry partial output
+            if batch.output_file_id:
+                outputs.update(parse_batch_output(client.files.content(batch.output_file_id).text))
+        pending = still_pending
+        if pending:
+            time.sleep(poll_interval)
+    return outputs
+
+
+def echo_responder(body):
+    return body["messages"][-1]["content"]
+
+
+class LocalBatchClient:
+    """File-based stand-in for the files/batches endpoints used by run_batches().
+
+    Uploaded files, outputs and batch states live under root, so a new
+    client on the same root picks up batches of an earlier process. A batch is reported as
+    in_progress on its first retrieve and is answered on the next one by
+    calling responder(request body) for every line, so the polling path is
+    exercised too. custom_ids listed in fail_ids get an error line instead.
+    """
+
+    def __init__(self, root, responder=echo_responder, fail_ids=()):
+        self.root = root
+        self.responder = responder
+        self.fail_ids = set(fail_ids)
+        os.makedirs(root, exist_ok=True)
+        self.files = SimpleNamespace(create=self._create_file, content=self._file_content)
+        self.batches = SimpleNamespace(create=self._create_batch, retrieve=self._retrieve_batch)
+
+    def _create_file(self, file, purpose):
+        file_id = "file-" + uuid.uuid4().hex
+        with open(os.path.join(self.root, file_id), "wb") as out:
+            out.write(file.read())
+        return SimpleNamespace(id=file_id, purpose=purpose)
+
+    def _file_content(self, file_id):
+        with open(os.path.join(self.root, file_id), encoding="utf-8") as f:
+            return SimpleNamespace(text=f.read())
+
+    def _create_batch(self, input_file_id, endpoint, completion_window):
+        batch = SimpleNamespace(id="batch-" + uuid.uuid4().hex, input_file_id=input_file_id,
+                                endpoint=endpoint, status="validating", output_file_id=None)
+        self._save_batch(batch)
+        return batch
+
+    def _save_batch(self, batch):
+        with open(os.path.join(self.root, batch.id + ".json"), "w", encoding="utf-8") as f:
+            json.dump(vars(batch), f)
+
+    def _retrieve_batch(self, batch_id):
+        with open(os.path.join(self.root, batch_id + ".json"), encoding="utf-8") as f:
+            batch = SimpleNamespace(**json.load(f))
+        if batch.status == "validating":
+            batch.status = "in_progress"
+        elif batch.status == "in_progress":
+            self._complete(batch)
+        self._save_batch(batch)
+        return batch
+
+    def _complete(self, batch):
+        lines = []
+        for line in self._file_content(batch.input_file_id).text.splitlines():
+            request = json.loads(line)
+            custom_id = request["custom_id"]
+            if custom_id in self.fail_ids:
+                lines.append({"custom_id": custom_id, "response": None,
+                              "error": {"code": "server_error", "message": "injected failure"}})
+                continue
+            content = self.responder(request["body"])
+            body = {"object": "chat.completion", "model": request["body"]["model"],
+                    "choices": [{"index": 0, "message": {"role": "assistant", "content": content},
+                                 "finish_reason": "stop"}]}
+            lines.append({"custom_id": custom_id, "response": {"status_code": 200, "body": body},
+                          "error": None})
+        data = "".join(json.dumps(line, ensure_ascii=False) + "\n" for line in lines)
+        output = self._create_file(io.BytesIO(data.encode("utf-8")), "batch_output")
+        batch.output_file_id = output.id
+        batch.status = "completed"
+
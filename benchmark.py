@@ -0,0 +1,166 @@
+import argparse
+import json
+import os
+import platform
+import resource
+import subprocess
+import tempfile
+import threading
+import time
+
+import numpy as np
+import openai
+import pandas as pd
+
+import run_experiments
+from mock_openai_server import MockOptions, start_server
+from request_engine import RateLimiter
+
+# (dataset, language, method) code paths covered; each translates, then predicts
+CASES = [
+    ('depression_reddit', 'greek', ''),
+    ('depression_reddit', 'greek', 'add_shot'),
+    ('depression_tweet', 'german', ''),
+    ('suicide', 'finnish', ''),
+]
+
+WORDS = ("i feel tired today work was hard and sleep does not help anymore friends call "
+         "but i stay home nothing seems worth it some days are better than others").split()
+
+
+def synthetic_dataset(n_rows, seed=0):
+    # Post lengths roughly follow the Reddit data: mostly short, with a long tail
+    rng = np.random.default_rng(seed)
+    lengths = np.clip(rng.lognormal(mean=4.0, sigma=0.8, size=n_rows).astype(int), 3, 600)
+    words = np.asarray(WORDS)
+    texts = [' '.join(words[rng.integers(0, len(words), length)]) for length in lengths]
+    return pd.DataFrame({'text': texts, 'label': rng.integers(0, 2, n_rows)})
+
+
+def current_rss():
+    # Resident set size in bytes; /proc is Linux-only, elsewhere fall back to the
+    # process-wide peak, which never goes down between cases
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except OSError:
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+class PeakMemory:
+    """Samples the RSS on a background thread; tracemalloc would slow the pipeline down several-fold."""
+
+    def __init__(self, interval=0.02):
+        self.interval = interval
+        self.peak = current_rss()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._sample, daemon=True)
+
+    def _sample(self):
+        while not self._stop.wait(self.interval):
+            self.peak = max(self.peak, current_rss())
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+        self.peak = max(self.peak, current_rss())
+
+
+def run_case(df, dataset, language, method, concurrency, pack_tokens=None):
+    # Time to first result is when run_language() receives its first finished row
+    first = []
+    run_ordered = run_experiments.run_ordered
+
+    def timed_run_ordered(fn, items, concurrency=1):
+        for result in run_ordered(fn, items, concurrency):
+            if not first:
+                first.append(time.perf_counter())
+            yield result
+
+    run_experiments.run_ordered = timed_run_ordered
+    start = time.perf_counter()
+    try:
+        with PeakMemory() as memory:
+            run_experiments.run_language(df, dataset, 'mock-model', language, method, concurrency,
+                                         pack_tokens=pack_tokens)
+    finally:
+        elapsed = time.perf_counter() - start
+        run_experiments.run_ordered = run_ordered
+    return {
+        'seconds': elapsed,
+        'rows_per_second': len(df) / elapsed,
+        'time_to_first_result': first[0] - start if first else None,
+        'peak_rss_mb': memory.peak / 1024**2,
+    }
+
+
+def git_commit():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'], text=True,
+                                       cwd=os.path.dirname(os.path.abspath(__file__))).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return 'unknown'
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Offline throughput benchmark of the translate->predict pipeline")
+    parser.add_argument('--sizes', type=int, nargs='+', default=[1000, 10000, 100000])
+    parser.add_argument('--concurrency', type=int, default=32)
+    parser.add_argument('--latency-ms', type=float, default=20.0)
+    parser.add_argument('--latency-sigma', type=float, default=0.5)
+    parser.add_argument('--error-429', type=float, default=0.0)
+    parser.add_argument('--error-5xx', type=float, default=0.0)
+    parser.add_argument('--verbose-rate', type=float, default=0.1)
+    parser.add_argument('--pack-tokens', type=int, help="pack rows into requests of about this many text tokens")
+    parser.add_argument('--output', help="JSON file to write (default: benchmarks/<commit>.json)")
+    args = parser.parse_args()
+
+    options = MockOptions(args.latency_ms, args.latency_sigma, args.error_429, args.error_5xx,
+                          verbose_rate=args.verbose_rate)
+    server = start_server(options)
+    run_experiments.client = openai.OpenAI(api_key="mock", base_url=server.url, max_retries=0)
+    run_experiments.limiter = RateLimiter()
+    run_experiments.cache = None
+    run_experiments.store = None
+
+    commit = git_commit()
+    output = os.path.abspath(args.output or os.path.join('benchmarks', commit + '.json'))
+    results = []
+    cwd = os.getcwd()
+    with tempfile.TemporaryDirectory() as workdir:
+        # run_language() writes to results/ relative to the working directory
+        os.chdir(workdir)
+        os.makedirs('results')
+        try:
+            for n_rows in args.sizes:
+                df = synthetic_dataset(n_rows)
+                for dataset, language, method in CASES:
+                    print(dataset, language, method or 'zero-shot', n_rows)
+                    requests_before = dict(server.counts)
+                    result = run_case(df.copy(), dataset, language, method, args.concurrency, args.pack_tokens)
+                    result.update(dataset=dataset, language=language, method=method, rows=n_rows,
+                                  requests=server.counts['requests'] - requests_before['requests'],
+                                  errors_429=server.counts['429'] - requests_before['429'],
+                                  errors_5xx=server.counts['5xx'] - requests_before['5xx'],
+                                  prompt_tokens=server.counts['prompt_tokens'] - requests_before['prompt_tokens'])
+                    print("  %.1f rows/s, first result after %.3fs, peak RSS %.1f MB"
+                          % (result['rows_per_second'], result['time_to_first_result'] or 0, result['peak_rss_mb']))
+                    results.append(result)
+        finally:
+            os.chdir(cwd)
+    server.shutdown()
+
+    os.makedirs(os.path.dirname(output), exist_ok=True)
+    with open(output, 'w') as f:
+        json.dump({
+            'commit': commit,
+            'created_at': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'python': platform.python_version(),
+            'config': vars(args),
+            'results': results,
+        }, f, indent=2)
+    print("Wrote", output)
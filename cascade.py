@@ -0,0 +1,114 @@
+import json
+
+import numpy as np
+from sklearn.feature_extraction.text import TfidfVectorizer
+from sklearn.linear_model import LogisticRegression
+from sklearn.model_selection import StratifiedKFold, cross_val_predict
+from sklearn.pipeline import make_pipeline
+
+from evaluation import confusion_counts, metrics_from_confusion
+from results_io import load_checkpoint
+
+SEVERITY_LABELS = {'minimum': 0, 'mild': 1, 'moderate': 2, 'severe': 3}
+
+# Thresholds on the local model's top probability covered by tradeoff()
+THRESHOLDS = (0.5, 0.6, 0.7, 0.8, 0.85, 0.9, 0.95, 0.99)
+
+
+def gold_labels(df, dataset):
+    # Class ids of the datasets as run_experiments.py loads them
+    if dataset=='depression_reddit':
+        return df['label'].str.lower().map(SEVERITY_LABELS).astype(int).to_numpy()
+    if dataset=='suicide':
+        return df['category'].astype(int).to_numpy()
+    return df['label'].astype(int).to_numpy()
+
+
+def load_local_rows(path):
+    """Indices of the rows a cascade run answered locally; empty when there is no cascade file."""
+    return {index for index, text in load_checkpoint(path, read_only=True).items() if json.loads(text)["local"]}
+
+
+def local_model():
+    # Character n-grams within word boundaries cope with typos and inflections
+    # without any tokenizer or pretrained weights
+    return make_pipeline(
+        TfidfVectorizer(analyzer='char_wb', ngram_range=(2, 5), min_df=2, sublinear_tf=True, max_features=300000),
+        LogisticRegression(C=4.0, max_iter=2000),
+    )
+
+
+def out_of_fold_scores(texts, labels, folds=5, seed=0, n_jobs=None):
+    """Class probabilities of every row from a local model fit without that row.
+
+    Each fold is scored by a model trained on the other folds, so the
+    confidence of a row says how well the model does on unseen text rather
+    than how well it memorized the row. Columns are the sorted class ids.
+    """
+    cv = StratifiedKFold(n_splits=folds, shuffle=True, random_state=seed)
+    return cross_val_predict(local_model(), list(texts), labels, cv=cv, method='predict_proba', n_jobs=n_jobs)
+
+
+class LocalCascade:
+    """Answers rows the local model is confident about and leaves the rest to the LLM.
+
+    A row is labelled locally when its top out-of-fold probability is at
+    least threshold; raising the threshold sends more rows to the LLM.
+    """
+
+    def __init__(self, index, texts, labels, threshold=0.9, folds=5, seed=0):
+        self.threshold = threshold
+        self.scores = out_of_fold_scores(texts, labels, folds, seed)
+        self._rows = {row_index: i for i, row_index in enumerate(index)}
+
+    def row_scores(self, index):
+        return self.scores[self._rows[index]].tolist()
+
+    def local_label(self, index):
+        """Class id for a confident row, None for a row that needs the LLM."""
+        scores = self.scores[self._rows[index]]
+        return int(scores.argmax()) if scores.max() >= self.threshold else None
+
+
+def tradeoff(y_true, local_scores, llm_labels, n_classes, calls_per_row=1, thresholds=THRESHOLDS):
+    """Accuracy of the cascade against the API calls it saves, per threshold.
+
+    llm_labels holds the parsed LLM answer of every row, or None where the LLM
+    was not asked (rows a cascade run answered locally). A threshold that
+    would need answers the LLM never gave is reported with missing > 0 and no
+    metrics. The row with threshold None is the LLM alone.
+    """
+    y_true = np.asarray(y_true)
+    confidence = local_scores.max(axis=1)
+    local_labels = local_scores.argmax(axis=1)
+    asked = np.array([label is not None for label in llm_labels])
+    llm = np.array([label if label is not None else -1 for label in llm_labels])
+    rows = []
+    for threshold in tuple(thresholds) + (None,):
+        local = confidence >= threshold if threshold is not None else np.zeros(len(y_true), dtype=bool)
+        missing = int((~local & ~asked).sum())
+        row = dict(threshold=threshold, local_rows=int(local.sum()), local_share=float(local.mean()),
+                   calls_saved=int(local.sum()) * calls_per_row, missing=missing,
+                   accuracy=None, macro_f1=None, local_accuracy=None)
+        if local.any():
+            row['local_accuracy'] = float((local_labels[local] == y_true[local]).mean())
+        if not missing:
+            metrics = metrics_from_confusion(confusion_counts(y_true, np.where(local, local_labels, llm), n_classes))
+            row['accuracy'] = float(metrics['accuracy'])
+            row['macro_f1'] = float(metrics['macro_f1'])
+        rows.append(row)
+    return rows
+
+
+def format_tradeoff(rows):
+    lines = ['threshold  local rows  calls saved  local acc  accuracy  macro F1']
+    for row in rows:
+        threshold = 'LLM only' if row['threshold'] is None else f"{row['threshold']:.2f}"
+        local_accuracy = '' if row['local_accuracy'] is None else f"{row['local_accuracy']:.4f}"
+        if row['missing']:
+            scores = f"n/a ({row['missing']} rows without an LLM answer)"
+        else:
+            scores = f"{row['accuracy']:8.4f}  {row['macro_f1']:8.4f}"
+        lines.append(f"{threshold:>9}  {row['local_rows']:5d} {row['local_share']:5.0%}  {row['calls_saved']:11d}  "
+                     f"{local_accuracy:>9}  {scores}")
+    return '\n'.join(lines)
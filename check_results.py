@@ -1,96 +1,37 @@
+import argparse
 import pandas as pd
-from sklearn.metrics import accuracy_score
-from tqdm import tqdm
-from retry import retry
-import time
-from sklearn.metrics import f1_score
+import os
+from concurrent.futures import ProcessPoolExecutor
 # import plotly.express as px
-from sklearn.metrics import classification_report
 # import plotly.io as pio
-from depression_utils import depression_count_answers_general
-from suicide_utils import suicide_count_answers_general
+from answer_parser import UNPARSEABLE, parse_file, unparseable_counts
+from cascade import format_tradeoff, load_local_rows, out_of_fold_scores, tradeoff
+from evaluation import evaluate, format_report
+from results_io import cascade_path
+from results_store import ResultsStore
+import matplotlib
+matplotlib.use('Agg')
 import matplotlib.pyplot as plt
 import numpy as np
 import seaborn as sns
-from sklearn.metrics import confusion_matrix
 # from erroranalysis import ErrorAnalyzer, ErrorHeatMap
 
-# language = 'french'
-# language = 'greek'
-# method = 'add_shot_'
-# method = ''
-model = 'gpt-3.5-turbo'
-# model = ''
-model = 'gpt-4o-mini'
-dataset = 'depression'
-languages = ['english', 'turkish', 'french', 'portuguese', 'german', 'greek', 'finnish']
-
-if dataset=='depression':
-    df = pd.read_csv("data/Depression_Severity_Dataset-main/Reddit_depression_dataset.csv", quotechar='"')
-    class_labels = ['Minimum', 'Mild', 'Moderate', 'Severe']
-    severity_mapping = {
-        'minimum': 0,
-        'mild': 1,
-        'moderate': 2,
-        'severe': 3
-    }
-    # Apply the mapping to the 'Severity' column
-    df['label'] = df['label'].map(severity_mapping)
-
-elif dataset=='suicide':
-    df = pd.read_csv("data/suicide/Labelled_tweets.tsv", header=0, delimiter="\t", quoting=3)
-    df = df.rename(columns={'tweet': 'text', 'category': 'label'})
-    # Define class labels (replace with your actual class labels)
-    class_labels = ['Class 0', 'Class 1', 'Class 2']
-
-# Organize F1-scores into lists for each class
-f1_scores_per_class = {label: [] for label in class_labels}
-
-f = open('results/'+method+model+'_all_'+dataset+'.txt', 'w')
-for language in languages:
-    print(language)
-    if dataset=='suicide':
-        f_trans = open('results/suic_preds_'+language+'.txt', 'r')
-        lines = f_trans.readlines()
-        f_trans.close()
-        # preds = count_greek_answers(lines)
-        preds = suicide_count_answers_general(lines, language)
-    elif dataset=='depression':
-        f_trans = open('results/'+method+model+'_reddit_preds_'+language+'.txt', 'r')
-        lines = f_trans.readlines()
-        f_trans.close()
-        # preds = count_greek_answers(lines)
-        preds = depression_count_answers_general(lines, language)
-
-    # import pdb; pdb.set_trace()
-    accuracy = accuracy_score(df['label'], preds)
-    print(accuracy)
-
-    report = classification_report(df['label'], preds)
-    f.write(language+"\nAccuracy: "+str(accuracy)+"\nReport\n: "+str(report)+"\n\n")
-
-    f1 = f1_score(df['label'], preds, average='macro')
-    f.write(f"Macro F1 Score: {f1}\n")
-    f1 = f1_score(df['label'], preds, average='micro')
-    f.write(f"Micro F1 Score: {f1}\n\n")
-
-    # Compute F1-score for each class
-    f1_scores = f1_score(df['label'], preds, average=None)
-    print(f1_scores)
-    for label, score in zip(class_labels, f1_scores):
-        f1_scores_per_class[label].append(score)
-
-    # Generate the confusion matrix
-    cm = confusion_matrix(df['label'], preds)
-
-    # Per-class accuracy
-    per_class_accuracy = cm.diagonal() / cm.sum(axis=1)
-
-    print("Per-class accuracy:", per_class_accuracy)
-    f.write("Per-class accuracy:" + str(per_class_accuracy)+"\n")
-
-    # Normalize the confusion matrix by row (true class)
-    cm_percentage = cm.astype('float') / cm.sum(axis=1)[:, np.newaxis] * 100
+
+def evaluate_language(job):
+    # Runs in a worker process: parse the predictions if needed, then score them
+    preds = job['preds']
+    if preds is None:
+        preds = parse_file(job['path'], job['parse_dataset'], job['language'], job['index'])
+    result = evaluate(job['y_true'], preds.to_numpy(), job['n_classes'], job['n_boot'])
+    result['unparseable_count'] = unparseable_counts(preds)
+    result['labels'] = preds.to_numpy()
+    return job['method'], job['model'], job['language'], result
+
+
+def plot_confusion(cm, class_labels, path):
+    # Normalize the confusion matrix by row (true class); unparseable answers
+    # are left out of the columns but still count in the row totals
+    cm_percentage = cm[:, :len(class_labels)].astype('float') / cm.sum(axis=1)[:, np.newaxis] * 100
 
     # Plot the normalized confusion matrix
     plt.figure(figsize=(8, 6))
@@ -101,26 +42,163 @@ for language in languages:
     # plt.show()
     # Save the plot as a high-quality PDF file with a tight layout
     plt.tight_layout()
-    plt.savefig('figures/'+method+model+'_confusion_matrix_percentage_'+language+'.pdf', format='pdf', dpi=300)
+    plt.savefig(path, format='pdf', dpi=300)
     # Close the plot to free up memory
     plt.close()
-    # Initialize ErrorAnalyzer with only labels and predictions
-    # analyzer = ErrorAnalyzer(df['label'], preds)
-    #
-    # # Create an error heatmap
-    # heatmap = ErrorHeatMap(analyzer)
-    # heatmap.visualize()
-
-    # # Prepare data for Plotly
-    # data = {
-    #     'Class': [f'Class {class_label}' for class_label, _ in f1_scores],
-    #     'F1-score': [score for _, score in f1_scores]
-    # }
-    # # Create a boxplot using Plotly
-    # fig = px.box(data, y='F1-score', x='Class', title='Boxplot of F1-scores per Class', points="all")
-    # pio.write_image(fig, 'figures/f1_scores_per_class.pdf', format='pdf')
-
-f.close()
+    return path
+
+
+if __name__ == "__main__":
+
+    # language = 'french'
+    # language = 'greek'
+    # method = 'add_shot_'
+    method = ''
+    model = 'gpt-3.5-turbo'
+    # model = ''
+    model = 'gpt-4o-mini'
+    dataset = 'depression'
+    languages = ['english', 'turkish', 'french', 'portuguese', 'german', 'greek', 'finnish']
+    # Every (method, model) pair is evaluated on every language
+    methods = [method]
+    models = [model]
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--workers', type=int, default=os.cpu_count(),
+                        help="processes used to parse and score the languages")
+    parser.add_argument('--bootstrap', type=int, default=1000,
+                        help="bootstrap replicates for the confidence intervals (0 to skip)")
+    parser.add_argument('--no-figures', action='store_true', help="skip the confusion matrix PDFs")
+    parser.add_argument('--cascade', action='store_true',
+                        help="report accuracy against API calls saved by the local classifier cascade")
+    args = parser.parse_args()
+
+    if dataset=='depression':
+        df = pd.read_csv("data/Depression_Severity_Dataset-main/Reddit_depression_dataset.csv", quotechar='"')
+        class_labels = ['Minimum', 'Mild', 'Moderate', 'Severe']
+        severity_mapping = {
+            'minimum': 0,
+            'mild': 1,
+            'moderate': 2,
+            'severe': 3
+        }
+        # Apply the mapping to the 'Severity' column
+        df['label'] = df['label'].map(severity_mapping)
+
+    elif dataset=='suicide':
+        df = pd.read_csv("data/suicide/Labelled_tweets.tsv", header=0, delimiter="\t", quoting=3)
+        df = df.rename(columns={'tweet': 'text', 'category': 'label'})
+        # Define class labels (replace with your actual class labels)
+        class_labels = ['Class 0', 'Class 1', 'Class 2']
+
+    # Parsed labels come from the results store when there is one (a single
+    # memory-mapped read of the label column for every language); languages not
+    # in it fall back to parsing the text results files
+    store_path = 'results/store'
+    parse_dataset = 'depression_reddit' if dataset=='depression' else dataset
+    stored = None
+    if os.path.isdir(store_path):
+        stored = ResultsStore(store_path).load_pandas(['label'], dataset=parse_dataset)
+
+    # One job per (method, model, language); parsing and metrics run in a process pool
+    jobs = []
+    for method in methods:
+        for model in models:
+            for language in languages:
+                rows = None
+                if stored is not None:
+                    rows = stored[(stored['language']==language) & (stored['model']==model) &
+                                  (stored['method']==method.rstrip('_'))]
+                if rows is not None and len(rows):
+                    preds = rows.set_index('row_index')['label'].reindex(df.index).fillna(UNPARSEABLE).astype(int)
+                    path = None
+                else:
+                    preds = None
+                    if dataset=='suicide':
+                        path = 'results/suic_preds_'+language+'.txt'
+                    elif dataset=='depression':
+                        path = 'results/'+method+model+'_reddit_preds_'+language+'.txt'
+                jobs.append(dict(method=method, model=model, language=language, preds=preds, path=path,
+                                 parse_dataset=parse_dataset, index=df.index, y_true=df['label'].to_numpy(),
+                                 n_classes=len(class_labels), n_boot=args.bootstrap))
+
+    with ProcessPoolExecutor(max_workers=args.workers) as executor, \
+            ProcessPoolExecutor(max_workers=args.workers) as figure_executor:
+        results = {}
+        figures = []
+        for method, model, language, result in executor.map(evaluate_language, jobs):
+            results[(method, model, language)] = result
+            # Figures render on their own workers while the remaining languages are scored
+            if not args.no_figures:
+                figures.append(figure_executor.submit(
+                    plot_confusion, result['confusion'], class_labels,
+                    'figures/'+method+model+'_confusion_matrix_percentage_'+language+'.pdf'))
+
+        for method in methods:
+            for model in models:
+                # Organize F1-scores into lists for each class
+                f1_scores_per_class = {label: [] for label in class_labels}
+
+                f = open('results/'+method+model+'_all_'+dataset+'.txt', 'w')
+                for language in languages:
+                    result = results[(method, model, language)]
+                    print(method+model, language)
+                    unparseable, total = result['unparseable_count']
+                    print("Unparseable:", unparseable, "of", total)
+                    print(result['accuracy'])
+                    f.write(language+"\nAccuracy: "+str(result['accuracy'])+"\nReport\n: "+format_report(result, class_labels)+"\n\n")
+                    f.write("Unparseable: "+str(unparseable)+" of "+str(total)+"\n")
+                    f.write(f"Macro F1 Score: {result['macro_f1']}\n")
+                    f.write(f"Micro F1 Score: {result['micro_f1']}\n\n")
+
+                    # F1-score for each class
+                    print(result['f1'])
+                    for label, score in zip(class_labels, result['f1']):
+                        f1_scores_per_class[label].append(score)
+
+                    print("Per-class accuracy:", result['per_class_accuracy'])
+                    f.write("Per-class accuracy:" + str(result['per_class_accuracy'])+"\n")
+                f.close()
+
+        if args.cascade:
+            # Out-of-fold probabilities of the local model, as run_experiments.py computes them
+            local_scores = out_of_fold_scores(df['text'].str.strip(), df['label'].to_numpy())
+            for method in methods:
+                for model in models:
+                    f = open('results/'+method+model+'_cascade_'+dataset+'.txt', 'w')
+                    for language in languages:
+                        labels = results[(method, model, language)]['labels']
+                        # Rows a cascade run answered locally have no LLM answer
+                        # Named by run_experiments.py, which writes the cascade file; its
+                        # method has no trailing '_', like in the results store
+                        local_rows = load_local_rows(cascade_path(parse_dataset, model, method.rstrip('_'), language))
+                        llm_labels = [None if index in local_rows else label for index, label in zip(df.index, labels)]
+                        rows = tradeoff(df['label'].to_numpy(), local_scores, llm_labels, len(class_labels),
+                                        calls_per_row=1 if language=='english' else 2)
+                        report = format_tradeoff(rows)
+                        print(method+model, language, "cascade")
+                        print(report)
+                        f.write(language+"\n"+report+"\n\n")
+                    f.close()
+
+        for figure in figures:
+            figure.result()
+
+        # Initialize ErrorAnalyzer with only labels and predictions
+        # analyzer = ErrorAnalyzer(df['label'], preds)
+        #
+        # # Create an error heatmap
+        # heatmap = ErrorHeatMap(analyzer)
+        # heatmap.visualize()
+
+        # # Prepare data for Plotly
+        # data = {
+        #     'Class': [f'Class {class_label}' for class_label, _ in f1_scores],
+        #     'F1-score': [score for _, score in f1_scores]
+        # }
+        # # Create a boxplot using Plotly
+        # fig = px.box(data, y='F1-score', x='Class', title='Boxplot of F1-scores per Class', points="all")
+        # pio.write_image(fig, 'figures/f1_scores_per_class.pdf', format='pdf')
 
 # Create a boxplot for each class
 # plt.figure(figsize=(10, 6))
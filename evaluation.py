@@ -0,0 +1,102 @@
+import numpy as np
+
+from answer_parser import UNPARSEABLE
+
+
+def confusion_counts(y_true, y_pred, n_classes):
+    """Confusion matrix of shape (n_classes, n_classes + 1) from one bincount.
+
+    Rows are true labels, columns predicted labels; the extra last column
+    counts UNPARSEABLE predictions so every row still sums to the class support.
+    """
+    y_true = np.asarray(y_true, dtype=np.int64)
+    y_pred = np.asarray(y_pred, dtype=np.int64)
+    y_pred = np.where(y_pred == UNPARSEABLE, n_classes, y_pred)
+    cells = y_true * (n_classes + 1) + y_pred
+    return np.bincount(cells, minlength=n_classes * (n_classes + 1)).reshape(n_classes, n_classes + 1)
+
+
+def _divide(num, den):
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return np.where(den > 0, num / np.where(den > 0, den, 1), 0.0)
+
+
+def metrics_from_confusion(cm):
+    """All metrics from confusion_counts() matrices; works on a stack of shape (..., n, n + 1).
+
+    F1 scores are over the real classes, so an unparseable answer is a missed
+    true positive that no class is credited for.
+    """
+    cm = np.asarray(cm, dtype=np.float64)
+    n_classes = cm.shape[-2]
+    tp = np.diagonal(cm[..., :n_classes], axis1=-2, axis2=-1)
+    support = cm.sum(axis=-1)
+    predicted = cm[..., :n_classes].sum(axis=-2)
+    total = support.sum(axis=-1)
+    precision = _divide(tp, predicted)
+    recall = _divide(tp, support)
+    f1 = _divide(2 * tp, predicted + support)
+    return {
+        'accuracy': _divide(tp.sum(axis=-1), total),
+        'precision': precision,
+        'recall': recall,
+        'f1': f1,
+        'macro_f1': f1.mean(axis=-1),
+        'micro_f1': _divide(2 * tp.sum(axis=-1), predicted.sum(axis=-1) + total),
+        # Per-class accuracy is the share of each true class predicted correctly
+        'per_class_accuracy': recall,
+        'support': support,
+        'unparseable': cm[..., n_classes].sum(axis=-1),
+    }
+
+
+def bootstrap_intervals(cm, n_boot=1000, alpha=0.05, seed=0):
+    """Percentile bootstrap confidence intervals for every metric.
+
+    Resampling rows with replacement only changes how many rows land in each
+    confusion cell, so the replicates are drawn directly as one multinomial
+    over the cells and all metrics are computed on the stack of matrices at once.
+    """
+    cm = np.asarray(cm)
+    total = cm.sum()
+    rng = np.random.default_rng(seed)
+    samples = rng.multinomial(total, cm.ravel() / total, size=n_boot).reshape((n_boot,) + cm.shape)
+    replicates = metrics_from_confusion(samples)
+    lower, upper = 100 * alpha / 2, 100 * (1 - alpha / 2)
+    return {name: (np.percentile(values, lower, axis=0), np.percentile(values, upper, axis=0))
+            for name, values in replicates.items()
+            if name not in ('support', 'unparseable')}
+
+
+def evaluate(y_true, y_pred, n_classes, n_boot=1000, seed=0):
+    cm = confusion_counts(y_true, y_pred, n_classes)
+    result = metrics_from_confusion(cm)
+    result['confusion'] = cm
+    if n_boot:
+        result['ci'] = bootstrap_intervals(cm, n_boot, seed=seed)
+    return result
+
+
+def format_report(result, class_labels):
+    """Text report in the layout of sklearn's classification_report, plus unparseable counts and CIs."""
+    width = max(len(name) for name in ['f1 ' + label for label in class_labels] + ['unparseable'])
+    lines = [' ' * width + '  precision    recall  f1-score   support', '']
+    for i, name in enumerate(class_labels):
+        lines.append(f"{name:>{width}}  {result['precision'][i]:9.2f} {result['recall'][i]:9.2f} "
+                     f"{result['f1'][i]:9.2f} {int(result['support'][i]):9d}")
+    total = int(result['support'].sum())
+    lines.append('')
+    lines.append(f"{'accuracy':>{width}}  {'':9} {'':9} {result['accuracy']:9.2f} {total:9d}")
+    lines.append(f"{'macro avg':>{width}}  {result['precision'].mean():9.2f} {result['recall'].mean():9.2f} "
+                 f"{result['macro_f1']:9.2f} {total:9d}")
+    lines.append(f"{'unparseable':>{width}}  {'':9} {'':9} {'':9} {int(result['unparseable']):9d}")
+    if 'ci' in result:
+        lines.append('')
+        lines.append('95% bootstrap confidence intervals')
+        for name in ('accuracy', 'macro_f1', 'micro_f1'):
+            low, high = result['ci'][name]
+            lines.append(f"{name:>{width}}  [{low:.4f}, {high:.4f}]")
+        low, high = result['ci']['f1']
+        for i, name in enumerate(class_labels):
+            lines.append(f"{'f1 ' + name:>{width}}  [{low[i]:.4f}, {high[i]:.4f}]")
+    return '\n'.join(lines)
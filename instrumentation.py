@@ -0,0 +1,148 @@
+import json
+import os
+import threading
+import time
+from collections import defaultdict
+
+import numpy as np
+
+LABELS = ('dataset', 'language', 'model', 'method', 'call')
+# Prometheus histogram buckets for request latency, in seconds
+LATENCY_BUCKETS = (0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+
+class _Series:
+    def __init__(self):
+        self.latencies = []
+        self.requests = 0
+        self.cache_hits = 0
+        self.prompt_tokens = 0
+        self.completion_tokens = 0
+        self.retries = 0
+        self.errors = defaultdict(int)
+        self.first_start = None
+        self.last_end = None
+
+
+class Recorder:
+    """Collects per-request latency, tokens, retries and errors of the LLM calls.
+
+    Series are keyed by LABELS. The dataset/language/model/method labels come
+    from context(), set by each worker thread before it processes a row; the
+    call label ('translate' or 'predict') is given per observation.
+    """
+
+    def __init__(self):
+        self._series = defaultdict(_Series)
+        self._lock = threading.Lock()
+        self._context = threading.local()
+
+    def reset(self):
+        """Drop every series, e.g. before the next language so its export holds only its own requests."""
+        with self._lock:
+            self._series = defaultdict(_Series)
+
+    def context(self, dataset, language, model, method):
+        self._context.labels = (dataset, language, model, method)
+
+    def _series_for(self, call):
+        labels = getattr(self._context, 'labels', ('', '', '', ''))
+        return self._series[labels + (call,)]
+
+    def observe(self, call, start, end, usage=None, error=None, cached=False):
+        """Record one request attempt that ran from start to end (time.time() values)."""
+        with self._lock:
+            series = self._series_for(call)
+            if cached:
+                # Served from the response cache: no latency or tokens were paid for
+                series.cache_hits += 1
+                return
+            series.requests += 1
+            if start is not None:
+                series.latencies.append(end - start)
+                series.first_start = start if series.first_start is None else min(series.first_start, start)
+                series.last_end = end if series.last_end is None else max(series.last_end, end)
+            if error is not None:
+                series.errors[type(error).__name__] += 1
+            if usage:
+                series.prompt_tokens += usage['prompt_tokens']
+                series.completion_tokens += usage['completion_tokens']
+
+    def retry_logger(self, call):
+        """Logger for the retry decorator: every warning it logs is one retry of call."""
+        return _RetryLogger(self, call)
+
+    def summary(self):
+        with self._lock:
+            rows = []
+            for key, series in sorted(self._series.items()):
+                latencies = np.asarray(series.latencies)
+                elapsed = (series.last_end - series.first_start) if series.first_start is not None else 0.0
+                p50, p95, p99 = np.percentile(latencies, [50, 95, 99]) if len(latencies) else (None, None, None)
+                rows.append(dict(
+                    zip(LABELS, key),
+                    requests=series.requests,
+                    cache_hits=series.cache_hits,
+                    retries=series.retries,
+                    errors=dict(series.errors),
+                    prompt_tokens=series.prompt_tokens,
+                    completion_tokens=series.completion_tokens,
+                    latency_p50=None if p50 is None else float(p50),
+                    latency_p95=None if p95 is None else float(p95),
+                    latency_p99=None if p99 is None else float(p99),
+                    latency_mean=float(latencies.mean()) if len(latencies) else None,
+                    requests_per_second=series.requests / elapsed if elapsed > 0 else None,
+                ))
+            return rows
+
+    def prometheus(self):
+        """Current metrics in the Prometheus text exposition format."""
+        lines = []
+        with self._lock:
+            items = sorted(self._series.items())
+            for name, kind, help_text in (
+                    ('llm_request_duration_seconds', 'histogram', 'Latency of LLM requests'),
+                    ('llm_requests_total', 'counter', 'LLM requests sent'),
+                    ('llm_cache_hits_total', 'counter', 'LLM calls served from the response cache'),
+                    ('llm_retries_total', 'counter', 'LLM calls retried'),
+                    ('llm_errors_total', 'counter', 'Failed LLM requests by error class'),
+                    ('llm_prompt_tokens_total', 'counter', 'Prompt tokens sent'),
+                    ('llm_completion_tokens_total', 'counter', 'Completion tokens received')):
+                lines.append(f'# HELP {name} {help_text}')
+                lines.append(f'# TYPE {name} {kind}')
+                for key, series in items:
+                    labels = ','.join(f'{label}="{value}"' for label, value in zip(LABELS, key))
+                    if name == 'llm_request_duration_seconds':
+                        latencies = np.asarray(series.latencies)
+                        for bucket in LATENCY_BUCKETS:
+                            lines.append(f'{name}_bucket{{{labels},le="{bucket}"}} {int((latencies <= bucket).sum())}')
+                        lines.append(f'{name}_bucket{{{labels},le="+Inf"}} {len(latencies)}')
+                        lines.append(f'{name}_sum{{{labels}}} {float(latencies.sum())}')
+                        lines.append(f'{name}_count{{{labels}}} {len(latencies)}')
+                    elif name == 'llm_errors_total':
+                        for error, count in sorted(series.errors.items()):
+                            lines.append(f'{name}{{{labels},error="{error}"}} {count}')
+                    else:
+                        attribute = name[len('llm_'):-len('_total')]
+                        lines.append(f'{name}{{{labels}}} {getattr(series, attribute)}')
+        return '\n'.join(lines) + '\n'
+
+    def export(self, path_prefix):
+        """Write path_prefix.json (summary with percentiles) and path_prefix.prom."""
+        directory = os.path.dirname(path_prefix)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with open(path_prefix + '.json', 'w') as f:
+            json.dump({'exported_at': time.time(), 'series': self.summary()}, f, indent=2)
+        with open(path_prefix + '.prom', 'w') as f:
+            f.write(self.prometheus())
+
+
+class _RetryLogger:
+    def __init__(self, recorder, call):
+        self.recorder = recorder
+        self.call = call
+
+    def warning(self, msg, *args):
+        with self.recorder._lock:
+            self.recorder._series_for(self.call).retries += 1
@@ -0,0 +1,50 @@
+import math
+
+# Number of classes per dataset; labels are the digits 0..n-1
+DATASET_LABELS = {
+    'depression_reddit': [0, 1, 2, 3],
+    'depression_tweet': [0, 1],
+    'suicide': [0, 1, 2],
+}
+
+# cl100k_base and o200k_base (gpt-3.5/4 and gpt-4o families) both encode the
+# single digits '0'..'9' as tokens 15..24. The ids are fixed rather than looked
+# up with tiktoken, which may need to download its encodings.
+DIGIT_TOKEN_OFFSET = 15
+
+
+def digit_token_ids(labels):
+    return {label: DIGIT_TOKEN_OFFSET + label for label in labels}
+
+
+def constrained_params(labels):
+    """Extra chat completion parameters that force a one-token answer from labels."""
+    return dict(
+        max_tokens=1,
+        logit_bias={str(token): 100 for token in digit_token_ids(labels).values()},
+        logprobs=True,
+        top_logprobs=min(20, max(len(labels), 5)),
+    )
+
+
+def label_scores(logprobs, labels):
+    """Turn the first token's top_logprobs into a probability per label.
+
+    logprobs is the choice's "logprobs" object as a dict. The bias added by
+    constrained_params() is the same for every label, so renormalising over
+    the labels recovers the model's relative preference between them. Labels
+    that are not among the top tokens get probability 0.
+    """
+    best = {label: -math.inf for label in labels}
+    content = (logprobs or {}).get("content") or []
+    if content:
+        for top in content[0].get("top_logprobs") or []:
+            token = top["token"].strip()
+            if token.isdigit() and int(token) in best:
+                best[int(token)] = max(best[int(token)], top["logprob"])
+    peak = max(best.values())
+    if peak == -math.inf:
+        return [0.0 for _ in labels]
+    weights = [math.exp(best[label] - peak) for label in labels]
+    total = sum(weights)
+    return [weight / total for weight in weights]
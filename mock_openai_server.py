@@ -0,0 +1,189 @@
+import argparse
+import hashlib
+import json
+import math
+import random
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from prompts import PACKED_PREDICTION_SUFFIX, PACKED_TRANSLATION_TEMPLATE
+
+PACKED_TRANSLATION_PREFIX = PACKED_TRANSLATION_TEMPLATE.split('{target_language}')[0]
+PACKED_PREDICTION_MARKER = PACKED_PREDICTION_SUFFIX.split('{n}')[0]
+PACKED_ITEMS_RE = re.compile(r'\[\{"id": 1, "text": ')
+TRANSLATION_RE = re.compile(r'^Translate the following text to [^:]+: (.*)\. Output only the translation\.$', re.DOTALL)
+LABEL_DIGIT_RE = re.compile(r'(?<!\w)([0-3])(?!\w)')
+
+
+class MockOptions:
+    """Behaviour of the stand-in server.
+
+    Latency is log-normal with the given median (ms) and sigma. error_429 and
+    error_5xx are the probabilities of answering with a rate-limit error
+    (carrying Retry-After) or a server error. verbose_rate is the share of
+    predictions answered with a sentence instead of a bare digit.
+    """
+
+    def __init__(self, latency_ms=20.0, latency_sigma=0.5, error_429=0.0, error_5xx=0.0,
+                 retry_after=0.1, verbose_rate=0.0, seed=0):
+        self.latency_ms = latency_ms
+        self.latency_sigma = latency_sigma
+        self.error_429 = error_429
+        self.error_5xx = error_5xx
+        self.retry_after = retry_after
+        self.verbose_rate = verbose_rate
+        self.seed = seed
+
+
+def _tokens(text):
+    return max(1, len(text.encode('utf-8')) // 4)
+
+
+def _label(prompt, n_labels):
+    # Deterministic per prompt so reruns and cached runs agree
+    return int(hashlib.sha256(prompt.encode('utf-8')).hexdigest(), 16) % n_labels
+
+
+def _packed_items(prompt):
+    match = PACKED_ITEMS_RE.search(prompt)
+    if match is None:
+        return None, None
+    items, _ = json.JSONDecoder().raw_decode(prompt, match.start())
+    return prompt[:match.start()], items
+
+
+def _n_labels(instruction):
+    digits = [int(d) for d in LABEL_DIGIT_RE.findall(instruction)]
+    return max(digits) + 1 if digits else 2
+
+
+def completion_content(body, rng, options):
+    prompt = body['messages'][-1]['content']
+    if prompt.startswith(PACKED_TRANSLATION_PREFIX) or PACKED_PREDICTION_MARKER in prompt:
+        instruction, items = _packed_items(prompt)
+        if prompt.startswith(PACKED_TRANSLATION_PREFIX):
+            reply = [{'id': item['id'], 'translation': item['text']} for item in items]
+        else:
+            reply = [{'id': item['id'], 'label': _label(item['text'], _n_labels(instruction))} for item in items]
+        return json.dumps(reply, ensure_ascii=False), None
+    translation = TRANSLATION_RE.match(prompt)
+    if translation:
+        return translation.group(1), None
+    if body.get('logit_bias'):
+        n_labels = len(body['logit_bias'])
+    else:
+        n_labels = _n_labels(prompt)
+    label = _label(prompt, n_labels)
+    logprobs = None
+    if body.get('logprobs'):
+        top = [{'token': str(label), 'logprob': math.log(0.7), 'bytes': None}]
+        top += [{'token': str(other), 'logprob': math.log(0.3 / (n_labels - 1)), 'bytes': None}
+                for other in range(n_labels) if other != label]
+        logprobs = {'content': [dict(top[0], top_logprobs=top)]}
+    if body.get('max_tokens') != 1 and rng.random() < options.verbose_rate:
+        return ('Based on the text provided, the severity level would be categorized as ' + str(label) +
+                '. The text describes several feelings that are consistent with this level.'), logprobs
+    return str(label), logprobs
+
+
+class MockOpenAIServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address, options):
+        super().__init__(address, _Handler)
+        self.options = options
+        self.rng = random.Random(options.seed)
+        self.lock = threading.Lock()
+        self.counts = {'requests': 0, '429': 0, '5xx': 0, 'prompt_tokens': 0}
+
+    @property
+    def url(self):
+        return 'http://%s:%d/v1' % self.server_address[:2]
+
+    def draw(self):
+        with self.lock:
+            self.counts['requests'] += 1
+            latency = self.options.latency_ms / 1000.0 * math.exp(self.rng.gauss(0, self.options.latency_sigma))
+            roll = self.rng.random()
+            return latency, roll, random.Random(self.rng.random())
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    # Headers and body go out in separate writes; without this every response
+    # waits on Nagle's algorithm and delayed ACKs (~40 ms)
+    disable_nagle_algorithm = True
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send(self, status, payload, headers=()):
+        data = json.dumps(payload).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        for name, value in headers:
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_POST(self):
+        body = json.loads(self.rfile.read(int(self.headers.get('Content-Length', 0))) or b'{}')
+        if not self.path.endswith('/chat/completions'):
+            self._send(404, {'error': {'message': 'not found', 'type': 'invalid_request_error'}})
+            return
+        server = self.server
+        options = server.options
+        latency, roll, rng = server.draw()
+        time.sleep(latency)
+        if roll < options.error_429:
+            with server.lock:
+                server.counts['429'] += 1
+            self._send(429, {'error': {'message': 'Rate limit reached', 'type': 'requests', 'code': 'rate_limit_exceeded'}},
+                       [('Retry-After', str(max(1, math.ceil(options.retry_after)))),
+                        ('retry-after-ms', str(int(options.retry_after * 1000)))])
+            return
+        if roll < options.error_429 + options.error_5xx:
+            with server.lock:
+                server.counts['5xx'] += 1
+            self._send(500, {'error': {'message': 'The server had an error', 'type': 'server_error'}})
+            return
+        content, logprobs = completion_content(body, rng, options)
+        prompt_tokens = sum(_tokens(message['content']) for message in body['messages'])
+        with server.lock:
+            server.counts['prompt_tokens'] += prompt_tokens
+        self._send(200, {
+            'id': 'chatcmpl-mock', 'object': 'chat.completion', 'created': int(time.time()),
+            'model': body.get('model', 'mock'),
+            'choices': [{'index': 0, 'message': {'role': 'assistant', 'content': content},
+                         'logprobs': logprobs, 'finish_reason': 'stop'}],
+            'usage': {'prompt_tokens': prompt_tokens, 'completion_tokens': _tokens(content),
+                      'total_tokens': prompt_tokens + _tokens(content)},
+        })
+
+
+def start_server(options=None, host='127.0.0.1', port=0):
+    """Start the mock server on a background thread; port 0 picks a free port."""
+    server = MockOpenAIServer((host, port), options or MockOptions())
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Local OpenAI-compatible chat completions stand-in")
+    parser.add_argument('--port', type=int, default=8000)
+    parser.add_argument('--latency-ms', type=float, default=20.0)
+    parser.add_argument('--latency-sigma', type=float, default=0.5)
+    parser.add_argument('--error-429', type=float, default=0.0)
+    parser.add_argument('--error-5xx', type=float, default=0.0)
+    parser.add_argument('--retry-after', type=float, default=0.1)
+    parser.add_argument('--verbose-rate', type=float, default=0.0)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+    options = MockOptions(args.latency_ms, args.latency_sigma, args.error_429, args.error_5xx,
+                          args.retry_after, args.verbose_rate, args.seed)
+    server = MockOpenAIServer(('127.0.0.1', args.port), options)
+    print("Serving on", server.url)
+    server.serve_forever()
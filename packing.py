@@ -0,0 +1,58 @@
+import json
+
+from request_engine import estimate_tokens
+
+# Tokens a packed item adds beyond its text: the JSON object around it and its answer
+ITEM_OVERHEAD_TOKENS = 12
+
+
+def pack_rows(rows, max_tokens, max_items):
+    """Group consecutive (index, text) rows into packs within a token budget.
+
+    A pack holds at most max_items rows whose estimated tokens (text plus
+    ITEM_OVERHEAD_TOKENS) add up to at most max_tokens; a row too long for the
+    budget gets a pack of its own. Packs keep the row order.
+    """
+    packs = []
+    pack = []
+    size = 0
+    for row in rows:
+        tokens = estimate_tokens(row[1]) + ITEM_OVERHEAD_TOKENS
+        if pack and (size + tokens > max_tokens or len(pack) >= max_items):
+            packs.append(pack)
+            pack = []
+            size = 0
+        pack.append(row)
+        size += tokens
+    if pack:
+        packs.append(pack)
+    return packs
+
+
+def parse_packed(content, n_items, field):
+    """Values of `field` for items 1..n_items from a packed reply, or None if the reply is unusable.
+
+    The reply must hold a JSON array (code fences or text around it are
+    ignored) of exactly n_items objects whose ids are 1..n_items, each
+    carrying `field`. Whether the individual values are valid is left to the caller.
+    """
+    start, end = content.find("["), content.rfind("]")
+    if start < 0 or end < start:
+        return None
+    try:
+        items = json.loads(content[start:end + 1])
+    except ValueError:
+        return None
+    if not isinstance(items, list) or len(items) != n_items:
+        return None
+    values = {}
+    for item in items:
+        if not isinstance(item, dict) or field not in item:
+            return None
+        try:
+            values[int(item.get("id"))] = item[field]
+        except (TypeError, ValueError):
+            return None
+    if sorted(values) != list(range(1, n_items + 1)):
+        return None
+    return [values[i] for i in range(1, n_items + 1)]
@@ -0,0 +1,136 @@
+import functools
+import random
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+
+def estimate_tokens(text):
+    # Rough upper bound used only for rate limiting: ~4 bytes per token.
+    # Counting UTF-8 bytes keeps non-Latin scripts (e.g. Greek) from being underestimated.
+    return max(1, len(text.encode("utf-8")) // 4)
+
+
+class RateLimiter:
+    """Token-bucket limiter for requests-per-minute and tokens-per-minute budgets.
+
+    Either limit may be None to disable it. acquire() blocks until both buckets
+    can cover the request and is safe to call from several threads.
+    """
+
+    def __init__(self, requests_per_minute=None, tokens_per_minute=None):
+        self.requests_per_minute = requests_per_minute
+        self.tokens_per_minute = tokens_per_minute
+        self._requests = float(requests_per_minute or 0)
+        self._tokens = float(tokens_per_minute or 0)
+        self._last = time.monotonic()
+        self._paused_until = 0.0
+        self._lock = threading.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        elapsed = now - self._last
+        self._last = now
+        if self.requests_per_minute:
+            self._requests = min(self.requests_per_minute,
+                                 self._requests + elapsed * self.requests_per_minute / 60.0)
+        if self.tokens_per_minute:
+            self._tokens = min(self.tokens_per_minute,
+                               self._tokens + elapsed * self.tokens_per_minute / 60.0)
+
+    def pause(self, seconds):
+        """Hold back every acquire() for the next `seconds`, e.g. after a 429 with Retry-After."""
+        with self._lock:
+            self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+
+    def acquire(self, tokens=0):
+        if self.tokens_per_minute:
+            # A single request larger than the whole budget can never fit, so cap it.
+            tokens = min(tokens, self.tokens_per_minute)
+        while True:
+            with self._lock:
+                self._refill()
+                wait = max(0.0, self._paused_until - self._last)
+                if self.requests_per_minute and self._requests < 1:
+                    wait = max(wait, (1 - self._requests) * 60.0 / self.requests_per_minute)
+                if self.tokens_per_minute and self._tokens < tokens:
+                    wait = max(wait, (tokens - self._tokens) * 60.0 / self.tokens_per_minute)
+                if wait == 0.0:
+                    if self.requests_per_minute:
+                        self._requests -= 1
+                    if self.tokens_per_minute:
+                        self._tokens -= tokens
+                    return
+            time.sleep(wait)
+
+
+def retry_after(error):
+    """Seconds the server asked to wait before retrying, from an HTTP error's headers, or None.
+
+    OpenAI sends retry-after-ms and Retry-After with its 429s; the HTTP-date
+    form of Retry-After is not supported.
+    """
+    headers = getattr(getattr(error, "response", None), "headers", None)
+    if not headers:
+        return None
+    for name, scale in (("retry-after-ms", 0.001), ("retry-after", 1.0)):
+        value = headers.get(name)
+        if value is not None:
+            try:
+                return max(0.0, float(value) * scale)
+            except ValueError:
+                pass
+    return None
+
+
+def backoff_retry(tries=5, delay=1.0, backoff=2.0, max_delay=60.0, jitter=0.5, retryable=None, logger=None):
+    """Decorator that retries a call failing with a transient error.
+
+    Errors for which retryable(error) is false are raised at once, as is the
+    last failure. Between attempts it waits for the server's Retry-After when
+    one was sent, otherwise delay * backoff**attempt (capped at max_delay)
+    plus up to `jitter` of that at random. Each retry is logged as a warning.
+    """
+    def decorator(fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            for attempt in range(tries):
+                try:
+                    return fn(*args, **kwargs)
+                except Exception as e:
+                    if attempt == tries - 1 or (retryable is not None and not retryable(e)):
+                        raise
+                    wait = retry_after(e)
+                    if wait is None:
+                        wait = min(max_delay, delay * backoff ** attempt)
+                        wait += random.uniform(0, jitter * wait)
+                    if logger is not None:
+                        logger.warning("%s, retrying in %.2f seconds...", e, wait)
+                    time.sleep(wait)
+        return wrapper
+    return decorator
+
+
+def run_ordered(fn, items, concurrency=1):
+    """Apply fn to every item on a thread pool and yield (item, result) in input order.
+
+    At most 4 * concurrency items are in flight, so results are written out
+    steadily instead of being buffered for the whole dataset.
+    """
+    if concurrency <= 1:
+        for item in items:
+            yield item, fn(item)
+        return
+
+    window = 4 * concurrency
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        in_flight = deque()
+        for item in items:
+            in_flight.append((item, executor.submit(fn, item)))
+            if len(in_flight) >= window:
+                done_item, future = in_flight.popleft()
+                yield done_item, future.result()
+        while in_flight:
+            done_item, future = in_flight.popleft()
+            yield done_item, future.result()
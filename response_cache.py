@@ -0,0 +1,129 @@
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+
+
+# Once over max_bytes, evict down to this share of it so the following puts
+# do not have to evict again straight away
+EVICT_TO = 0.9
+# Oldest entries are read this many at a time while evicting
+EVICT_CHUNK = 1000
+
+
+class CacheMiss(KeyError):
+    """Raised in replay mode when a request has no stored response."""
+
+
+def cache_key(request):
+    # Requests are plain JSON (model, messages, temperature, seed, ...), so a
+    # canonical dump is a stable content address for them.
+    payload = json.dumps(request, sort_keys=True, ensure_ascii=False, separators=(",", ":"))
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class ResponseCache:
+    """On-disk SQLite cache of chat completion responses keyed by cache_key().
+
+    Entries are evicted least-recently-used first once their total size goes
+    over max_bytes, down to EVICT_TO of it. In replay mode the database is opened read-only and a
+    missing entry raises CacheMiss instead of letting the request through.
+    """
+
+    def __init__(self, path, max_bytes=None, replay=False):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.replay = replay
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        if replay:
+            self._conn = sqlite3.connect("file:" + path + "?mode=ro", uri=True, check_same_thread=False)
+        else:
+            self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS responses ("
+                "key TEXT PRIMARY KEY, value TEXT NOT NULL, size INTEGER NOT NULL, last_used REAL NOT NULL)"
+            )
+            self._conn.execute("CREATE INDEX IF NOT EXISTS responses_last_used ON responses (last_used)")
+        self._size = self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+
+    def get(self, key):
+        with self._lock:
+            row = self._conn.execute("SELECT value FROM responses WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                self.misses += 1
+                if self.replay:
+                    raise CacheMiss(key)
+                return None
+            self.hits += 1
+            if not self.replay:
+                self._conn.execute("UPDATE responses SET last_used = ? WHERE key = ?", (time.time(), key))
+            return json.loads(row[0])
+
+    def put(self, key, value):
+        if self.replay:
+            return
+        data = json.dumps(value, ensure_ascii=False)
+        size = len(data.encode("utf-8"))
+        with self._lock:
+            old = self._conn.execute("SELECT size FROM responses WHERE key = ?", (key,)).fetchone()
+            self._conn.execute(
+                "INSERT OR REPLACE INTO responses (key, value, size, last_used) VALUES (?, ?, ?, ?)",
+                (key, data, size, time.time()),
+            )
+            self._size += size - (old[0] if old else 0)
+            if self.max_bytes is not None and self._size > self.max_bytes:
+                self._evict()
+
+    def _evict(self):
+        target = self.max_bytes * EVICT_TO
+        self._conn.execute("BEGIN")
+        try:
+            while self._size > target:
+                rows = self._conn.execute("SELECT key, size FROM responses ORDER BY last_used LIMIT ?",
+                                          (EVICT_CHUNK,)).fetchall()
+                if not rows:
+                    break
+                evicted = []
+                for key, size in rows:
+                    if self._size <= target:
+                        break
+                    evicted.append((key,))
+                    self._size -= size
+                self._conn.executemany("DELETE FROM responses WHERE key = ?", evicted)
+            self._conn.execute("COMMIT")
+        except BaseException:
+            self._conn.execute("ROLLBACK")
+            self._size = self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+            raise
+
+    def discard(self, request):
+        """Drop the stored response for request so the next fetch() asks the API again."""
+        if self.replay:
+            return
+        key = cache_key(request)
+        with self._lock:
+            row = self._conn.execute("SELECT size FROM responses WHERE key = ?", (key,)).fetchone()
+            if row is not None:
+                self._conn.execute("DELETE FROM responses WHERE key = ?", (key,))
+                self._size -= row[0]
+
+    def fetch(self, request, create):
+        """Return the cached response for request, calling create() on a miss."""
+        key = cache_key(request)
+        value = self.get(key)
+        if value is None:
+            value = create()
+            self.put(key, value)
+        return value
+
+    def stats(self):
+        with self._lock:
+            entries = self._conn.execute("SELECT COUNT(*) FROM responses").fetchone()[0]
+        return {"hits": self.hits, "misses": self.misses, "entries": entries, "bytes": self._size}
+
+    def close(self):
+        self._conn.close()
@@ -0,0 +1,103 @@
+import os
+import time
+
+
+def format_line(index, text):
+    return str(index)+": "+str(text).replace("\n", " ").replace("\r", " ")+"\n"
+
+
+def results_paths(dataset, model, method, language):
+    """(translations, predictions) file paths of one run, as run_experiments.py writes them."""
+    if dataset=='depression_reddit':
+        prefix = 'results/'+method+'_'+model+'_reddit_'
+    elif dataset=='depression_tweet':
+        prefix = 'results/'+model+'_dep_tweet_'
+    elif dataset=='suicide':
+        prefix = 'results/'+model+'_suic_'
+    return prefix+'translations_'+language+'.txt', prefix+'preds_'+language+'.txt'
+
+
+def scores_path(dataset, model, method, language):
+    # Per-class probabilities from constrained predictions, next to the preds file
+    return results_paths(dataset, model, method, language)[1].replace('_preds_', '_scores_')
+
+
+def cascade_path(dataset, model, method, language):
+    # Local model probabilities of every row and whether it was answered locally, next to the preds file
+    return results_paths(dataset, model, method, language)[1].replace('_preds_', '_cascade_')
+
+
+def load_checkpoint(path, read_only=False):
+    """Read an "index: text" results file into {index: text}.
+
+    A trailing line without a newline is what an interrupted write leaves
+    behind, so it is cut off the file and its row is treated as not done.
+    With read_only the line is only skipped and the file is left untouched,
+    for readers that may run while a writer is still appending.
+    Missing files yield an empty dict.
+    """
+    if not os.path.exists(path):
+        return {}
+    with open(path, 'rb' if read_only else 'rb+') as f:
+        data = f.read()
+        end = data.rfind(b"\n") + 1
+        if end < len(data) and not read_only:
+            f.truncate(end)
+    done = {}
+    # Only "\n" ends a row: splitlines() would also break on characters such as
+    # \x85 or \u2028 that format_line() leaves inside a translation
+    for line in data[:end].decode("utf-8").split("\n"):
+        index, _, text = line.partition(": ")
+        if index.strip().lstrip("-").isdigit():
+            done[int(index)] = text
+    return done
+
+
+class CheckpointWriter:
+    """Line writer that fsyncs every `every` lines or `interval` seconds and on close.
+
+    After a crash at most the rows written since the last checkpoint are lost.
+    """
+
+    def __init__(self, path, mode='w', every=50, interval=30.0):
+        self.f = open(path, mode, encoding="utf-8")
+        self.every = every
+        self.interval = interval
+        self._pending = 0
+        self._last_sync = time.monotonic()
+
+    def write(self, index, text):
+        self.f.write(format_line(index, text))
+        self._pending += 1
+        if self._pending >= self.every or time.monotonic() - self._last_sync >= self.interval:
+            self.sync()
+
+    def sync(self):
+        self.f.flush()
+        os.fsync(self.f.fileno())
+        self._pending = 0
+        self._last_sync = time.monotonic()
+
+    def close(self):
+        if not self.f.closed:
+            self.sync()
+            self.f.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def rewrite_results(path, rows):
+    """Replace a results file with {index: text} in index order.
+
+    The new file is written next to the old one and swapped in, so a crash
+    leaves either the old or the new file, never a mix.
+    """
+    tmp_path = path + '.tmp'
+    with CheckpointWriter(tmp_path, 'w') as f:
+        for index in sorted(rows):
+            f.write(index, rows[index])
+    os.replace(tmp_path, path)
@@ -0,0 +1,111 @@
+import os
+import time
+import uuid
+
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.parquet as pq
+
+KEY = ['dataset', 'model', 'method', 'language', 'row_index']
+
+SCHEMA = pa.schema([
+    ('dataset', pa.string()),
+    ('model', pa.string()),
+    ('method', pa.string()),
+    ('language', pa.string()),
+    ('row_index', pa.int64()),
+    ('translation', pa.string()),
+    ('prediction', pa.string()),
+    ('label', pa.int64()),
+    ('scores', pa.list_(pa.float64())),
+    ('latency', pa.float64()),
+    ('prompt_tokens', pa.int64()),
+    ('completion_tokens', pa.int64()),
+    ('written_at', pa.timestamp('us')),
+])
+
+
+class ResultsStore:
+    """Parquet-backed store of per-row results keyed by KEY.
+
+    Every append() writes a new Parquet file under root, so appends are cheap
+    and never rewrite earlier data. When a key was written more than once the
+    most recent row wins on load(); compact() folds everything into one file.
+    """
+
+    def __init__(self, root):
+        self.root = root
+        os.makedirs(root, exist_ok=True)
+
+    def _files(self):
+        return sorted(os.path.join(self.root, name) for name in os.listdir(self.root)
+                      if name.endswith('.parquet'))
+
+    def append(self, dataset, model, method, language, rows):
+        """Append {row_index: {column: value}} for one (dataset, model, method, language)."""
+        if not rows:
+            return
+        columns = {name: [] for name in SCHEMA.names}
+        now = time.time()
+        for row_index, row in rows.items():
+            for name, value in (('dataset', dataset), ('model', model), ('method', method),
+                                ('language', language), ('row_index', int(row_index))):
+                columns[name].append(value)
+            for name in SCHEMA.names[len(KEY):-1]:
+                columns[name].append(row.get(name))
+            columns['written_at'].append(int(now * 1e6))
+        table = pa.Table.from_pydict(columns, schema=SCHEMA)
+        name = 'part-' + time.strftime('%Y%m%d%H%M%S') + '-' + uuid.uuid4().hex[:8] + '.parquet'
+        # Write under a temporary name so readers never see a half-written file
+        tmp_path = os.path.join(self.root, '.' + name + '.tmp')
+        pq.write_table(table, tmp_path)
+        os.replace(tmp_path, os.path.join(self.root, name))
+
+    def load(self, columns=None, **filters):
+        """Read the store memory-mapped as a pyarrow Table with only the requested columns.
+
+        Keyword filters select on key columns, e.g. load(['prediction'], dataset='depression_reddit').
+        Key columns are always returned.
+        """
+        files = self._files()
+        if not files:
+            return SCHEMA.empty_table() if columns is None else \
+                pa.schema([SCHEMA.field(name) for name in _with_key(columns)]).empty_table()
+        read_columns = None if columns is None else _with_key(columns) + ['written_at']
+        pq_filters = [(name, '=', value) for name, value in filters.items()] or None
+        table = pq.read_table(files, columns=read_columns, filters=pq_filters, memory_map=True)
+        table = _latest(table)
+        if columns is not None:
+            table = table.select(_with_key(columns))
+        return table
+
+    def load_pandas(self, columns=None, **filters):
+        return self.load(columns, **filters).to_pandas()
+
+    def compact(self):
+        """Rewrite the store as a single file holding only the latest row per key."""
+        files = self._files()
+        if len(files) < 2:
+            return
+        table = _latest(pq.read_table(files, memory_map=True))
+        name = 'part-' + time.strftime('%Y%m%d%H%M%S') + '-compact.parquet'
+        tmp_path = os.path.join(self.root, '.' + name + '.tmp')
+        pq.write_table(table, tmp_path)
+        os.replace(tmp_path, os.path.join(self.root, name))
+        for path in files:
+            os.remove(path)
+
+
+def _with_key(columns):
+    return KEY + [name for name in columns if name not in KEY]
+
+
+def _latest(table):
+    # Keep the most recently written row of every key
+    if table.num_rows == 0:
+        return table
+    order = pc.sort_indices(table, sort_keys=[('written_at', 'descending')])
+    table = table.take(order)
+    keys = table.select(KEY).to_pandas()
+    first = ~keys.duplicated(keep='first').to_numpy()
+    return table.filter(pa.array(first))
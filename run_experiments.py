@@ -1,182 +1,642 @@
 import openai
 import pandas as pd
-from sklearn.metrics import accuracy_score
 from tqdm import tqdm
-from retry import retry
 import time
 
+import argparse
+import json
 import os
+import threading
 from dotenv import load_dotenv
 
+from batch_backend import LocalBatchClient, run_batches
+from cascade import LocalCascade, gold_labels, load_local_rows
+from label_scoring import DATASET_LABELS, constrained_params, label_scores
+from packing import pack_rows, parse_packed
+from prompts import (check_supported, packed_prediction_prompt, packed_translation_prompt, prediction_prompt,
+                     translation_prompt)
+from request_engine import RateLimiter, backoff_retry, estimate_tokens, retry_after, run_ordered
+from response_cache import CacheMiss, ResponseCache, cache_key
+from results_io import CheckpointWriter, cascade_path, load_checkpoint, results_paths, rewrite_results, scores_path
+from results_store import ResultsStore
+from answer_parser import UNPARSEABLE, parse_answers
+from instrumentation import Recorder
+
 # Load environment variables from .env file
 load_dotenv()
 
 # Get the API key from the environment
 api_key = os.getenv("OPENAI_API_KEY")
 
-# Set your OpenAI API key
-client = openai.OpenAI(api_key)
+# OpenAI client, created by get_client() when the first request is sent so
+# that replaying responses from the cache needs no API key
+client = None
+_client_lock = threading.Lock()
+
+# Shared by every worker thread; limits are set in the configuration block below
+limiter = RateLimiter()
+# Optional ResponseCache consulted before every request
+cache = None
+# Optional ResultsStore that replaces the per-language CSV copies of the dataset
+store = None
+# Token counts of the requests made for the row a worker thread is processing
+_row_usage = threading.local()
+# Latency, token, retry and error metrics of every request, exported per language
+recorder = Recorder()
+# Written in place of a translation or prediction whose request failed for good
+ERROR = "openai error"
+
+
+def get_client():
+    # Retries are done by backoff_retry() below, which also makes every worker
+    # wait out a 429's Retry-After
+    global client
+    with _client_lock:
+        if client is None:
+            client = openai.OpenAI(api_key=api_key, max_retries=0)
+    return client
+
+
+def build_request(model, prompt, labels=None):
+    request = dict(
+        model=model,
+        messages=[
+            {"role": "system", "content": "You are a helpful assistant."},
+            {"role": "user", "content": prompt}
+        ],
+        temperature=0,
+        seed=20
+    )
+    if labels is not None:
+        request.update(constrained_params(labels))
+    return request
+
+
+def completion_value(choice, labels=None):
+    # choice is one chat completion choice as a plain dict, with the response's usage added
+    value = {"content": choice["message"]["content"]}
+    if labels is not None:
+        value["scores"] = label_scores(choice.get("logprobs"), labels)
+    usage = choice.get("usage")
+    if usage:
+        value["usage"] = {"prompt_tokens": usage["prompt_tokens"], "completion_tokens": usage["completion_tokens"]}
+    return value
+
+
+def add_row_usage(value):
+    totals = getattr(_row_usage, "totals", None)
+    usage = value.get("usage")
+    if totals is not None and usage:
+        totals["prompt_tokens"] += usage["prompt_tokens"]
+        totals["completion_tokens"] += usage["completion_tokens"]
+
+
+def clean_content(content):
+    # content is None when the model answered with nothing (e.g. a refusal)
+    return (content or "").strip().replace("\n","")
+
+
+def chat_completion(model, prompt, labels=None, call="predict"):
+    request = build_request(model, prompt, labels)
+    sent = []
+
+    def create():
+        limiter.acquire(estimate_tokens(prompt))
+        start = time.time()
+        sent.append(start)
+        try:
+            response = get_client().chat.completions.create(**request)
+        except Exception as e:
+            recorder.observe(call, start, time.time(), error=e)
+            wait = retry_after(e)
+            if wait:
+                limiter.pause(wait)
+            raise
+        usage = response.usage.model_dump() if response.usage else None
+        recorder.observe(call, start, time.time(), usage=usage)
+        return completion_value(dict(response.choices[0].model_dump(), usage=usage), labels)
+
+    if cache is None:
+        value = create()
+    else:
+        value = cache.fetch(request, create)
+        if not sent:
+            recorder.observe(call, None, None, cached=True)
+    add_row_usage(value)
+    return value
+
+
+def is_retryable(error):
+    # Rate limits, timeouts, dropped connections and server errors are worth another try
+    if getattr(error, "code", None) == "insufficient_quota":
+        return False
+    if isinstance(error, openai.APIConnectionError):
+        return True
+    status = getattr(error, "status_code", None)
+    return status is not None and (status in (408, 409, 429) or status >= 500)
+
+
+@backoff_retry(tries=5, delay=1, backoff=2, retryable=is_retryable, logger=recorder.retry_logger("translate"))
+def request_translation(text, model, target_language):
+    prompt = translation_prompt(text, target_language)
+    return clean_content(chat_completion(model, prompt, call="translate")["content"])
+
+
+@backoff_retry(tries=5, delay=1, backoff=2, retryable=is_retryable, logger=recorder.retry_logger("predict"))
+def request_prediction(dataset, model, text, language, method, constrained=False):
+    prompt = prediction_prompt(dataset, text, language, method)
+    labels = DATASET_LABELS[dataset] if constrained else None
+    value = chat_completion(model, prompt, labels)
+    return clean_content(value["content"]), value.get("scores")
+
+
+@backoff_retry(tries=5, delay=1, backoff=2, retryable=is_retryable, logger=recorder.retry_logger("translate"))
+def request_packed_translations(texts, model, target_language):
+    prompt = packed_translation_prompt(texts, target_language)
+    return parse_packed(chat_completion(model, prompt, call="translate")["content"] or "", len(texts), "translation")
+
+
+@backoff_retry(tries=5, delay=1, backoff=2, retryable=is_retryable, logger=recorder.retry_logger("predict"))
+def request_packed_predictions(dataset, model, texts, language, method):
+    prompt = packed_prediction_prompt(dataset, texts, language, method)
+    return parse_packed(chat_completion(model, prompt)["content"] or "", len(texts), "label")
+
 
-@retry(tries=3, delay=1, backoff=2, jitter=(0.5, 2.0))
 def translate_text(text, model, target_language):
-    prompt = f"Translate the following text to {target_language}: {text}. Output only the translation."
-    translation = ""
+    # An API request still failing after its retries is recorded as ERROR for
+    # repair_language(); any other error is a bug and stops the run
     try:
-        response = client.chat.completions.create(
-            model=model,
-            messages=[
-                {"role": "system", "content": "You are a helpful assistant."},
-                {"role": "user", "content": prompt}
-            ],
-            temperature=0,
-            seed=20
-        )
-        translation = response.choices[0].message.content.strip().replace("\n","")
-    except:
-        translation = "openai error"
-        pass
-
-    return translation
-
-
-@retry(tries=3, delay=1, backoff=2, jitter=(0.5, 2.0))
-def predict(dataset, model, text, language, method):
-    if dataset=='depression_reddit':
-        if language=='english':
-            prompt = f"categorize the following text with 1 of the 4 depression severity levels (0: Minimum, 1: Mild, 2: Moderate, 3: Severe): {text}. please output only 0, 1, 2, or 3"
-            add_shot = "Here are some examples. ""Had a bit of a rough week at work, but overall, I'm doing okay. I’ve been feeling a little down, but I think it's just from being tired. Planning to spend the weekend relaxing and recharging. I'm looking forward to catching up on some hobbies."": Minimum. ""Lately, I've been feeling a bit more down than usual. It’s like a grey cloud follows me around. I'm still functioning and getting things done, but I find it harder to enjoy the things I used to. I'm trying to push through it, but it's tough."": Mild. ""I’ve been finding it really hard to get out of bed lately. Everything feels pointless, and I can’t remember the last time I genuinely felt happy. I’ve started skipping social events because I just don’t have the energy. I’m trying to keep it together at work, but it’s getting harder every day."": Moderate. ""I don't see the point in anything anymore. I’ve completely isolated myself from everyone, and even getting out of bed feels impossible. I’m constantly thinking that things would be better if I just disappeared. I feel like I'm trapped in this dark place with no way out."": Severe"
-        elif language=='turkish':
-            prompt = f"Aşağıdaki metni 4 depresyon şiddet seviyesinden 1'i (0: Minimum, 1: Hafif, 2: Orta, 3: Şiddetli) ile kategorilendirin: {text}. lütfen yalnızca 0, 1, 2 veya 3 çıktısını verin"
-            add_shot = "İşte birkaç örnek. ""İş yerinde biraz zor bir hafta geçirdim ama genel olarak iyiyim. Kendimi biraz kötü hissediyorum ama bunun sadece yorgun olmaktan kaynaklandığını düşünüyorum. Hafta sonunu dinlenerek ve enerji toplayarak geçirmeyi planlıyorum. Bazı hobilerimi yapmayı dört gözle bekliyorum."": Minimum. ""Son zamanlarda, normalden biraz daha kötü hissediyorum. Sanki etrafımda gri bir bulut dolaşıyor. Hala işimi yapıyorum ve işlerimi hallediyorum ama eskiden yaptığım şeylerden zevk almam zorlaşıyor. Bunu aşmaya çalışıyorum ama zor."": Hafif. ""Son zamanlarda yataktan çıkmakta gerçekten zorlanıyorum. Her şey anlamsız geliyor ve gerçekten mutlu hissettiğim son zamanı hatırlamıyorum. Sosyal etkinlikleri atlamaya başladım çünkü enerjim yok. İş yerinde kendimi toparlamaya çalışıyorum ama her geçen gün daha da zorlaşıyor."": Orta. ""Artık hiçbir şeyin anlamını göremiyorum. Kendimi herkesten tamamen soyutladım ve yataktan çıkmak bile imkansız gibi geliyor. Sürekli olarak ortadan kaybolursam her şeyin daha iyi olacağını düşünüyorum. Çıkış yolu olmayan karanlık bir yerde sıkışıp kalmış gibi hissediyorum."": Şiddetli"
-        elif language=='portuguese':
-            prompt = f"categorize o texto a seguir com 1 dos 4 níveis de gravidade da depressão (0: Mínimo, 1: Leve, 2: Moderado, 3: Grave): {text}. por favor, imprima apenas 0, 1, 2 ou 3"
-            add_shot = "Aqui estão alguns exemplos. ""Tive uma semana difícil no trabalho, mas no geral estou bem. Estou a sentir-me um pouco desanimado, mas acho que é só por estar cansado. Planear passar o fim de semana a relaxar e a recarregar energias. Estou ansioso por pôr alguns passatempos em dia."": Mínimo. ""Ultimamente, tenho-me sentido um pouco mais deprimido do que o habitual. É como se uma nuvem cinzenta me seguisse. Ainda estou a trabalhar e a fazer as coisas, mas acho mais difícil desfrutar das coisas que costumava fazer. Estou a tentar ultrapassar isto, mas é difícil."": Leve. ""Tenho tido muita dificuldade em sair da cama ultimamente. Tudo parece inútil e não me consigo lembrar da última vez que me senti genuinamente feliz. Comecei a faltar a eventos sociais porque simplesmente não tenho energia. Estou a tentar controlar-me no trabalho, mas está a tornar-se mais difícil a cada dia que passa."": Moderado. ""Já não vejo sentido em nada. Isolei-me completamente de todos e até sair da cama parece impossível. Estou constantemente a pensar que as coisas seriam melhores se eu simplesmente desaparecesse. Sinto que estou preso neste lugar escuro e sem saída."": Grave"
-        elif language=='german':
-            prompt = f"Kategorisieren Sie den folgenden Text mit einem der vier Schweregrade einer Depression (0: minimal, 1: leicht, 2: mittelschwer, 3: schwer): {text}. bitte nur 0, 1, 2 oder 3 ausgeben"
-            add_shot = "Hier sind einige Beispiele. „Hatten eine ziemlich harte Woche bei der Arbeit, aber insgesamt geht es mir gut. Ich fühle mich ein bisschen niedergeschlagen, aber ich glaube, das liegt einfach an der Müdigkeit. Ich habe vor, das Wochenende zu verbringen, um mich zu entspannen und neue Kraft zu tanken. Ich freue mich darauf, ein paar Hobbys wieder aufzunehmen.“: Minimal. „In letzter Zeit fühle ich mich ein bisschen niedergeschlagener als sonst. Es ist, als würde mir eine graue Wolke folgen. Ich funktioniere immer noch und erledige Dinge, aber es fällt mir schwerer, die Dinge zu genießen, die ich früher genossen habe. Ich versuche, mich durchzukämpfen, aber es ist hart.“: Leicht. „In letzter Zeit fällt es mir wirklich schwer, aus dem Bett zu kommen. Alles fühlt sich sinnlos an und ich kann mich nicht erinnern, wann ich das letzte Mal wirklich glücklich war. Ich habe angefangen, gesellschaftliche Veranstaltungen auszulassen, weil mir einfach die Energie fehlt. Ich versuche, mich bei der Arbeit zusammenzureißen, aber es wird von Tag zu Tag schwieriger.“: mittelschwer. „Ich sehe in nichts mehr den Sinn. Ich habe mich völlig von allen isoliert und es ist mir sogar unmöglich, aus dem Bett aufzustehen. Ich denke ständig, dass alles besser wäre, wenn ich einfach verschwinden würde. Ich fühle mich, als wäre ich an diesem dunklen Ort gefangen und hätte keinen Ausweg.“: Schwer"
-        elif language=='finnish':
-            prompt = f"Luokittele seuraava teksti yhdelle neljästä masennuksen vaikeusasteesta (0: minimi, 1: lievä, 2: kohtalainen, 3: vaikea): {text}. anna vain 0, 1, 2 tai 3"
-            add_shot = "Tässä muutamia esimerkkejä. ""Töissä oli vähän rankka viikko, mutta kaiken kaikkiaan voin hyvin. Olen ollut hieman masentunut, mutta luulen sen johtuvan vain väsymyksestä. Viikonloppu on tarkoitus viettää rentoutuen ja latautuen. Odotan innolla harrastuksia."": Minimi. ""Olen viime aikoina tuntenut oloni hieman masemmaksi kuin tavallisesti. Tuntuu kuin harmaa pilvi seuraisi minua. Toimin edelleen ja teen asioita, mutta minun on vaikeampi nauttia asioista, joita ennen. Yritän päästä sen läpi, mutta se on vaikeaa."": Lievä. ""Minun on ollut viime aikoina todella vaikeaa nousta sängystä. Kaikki tuntuu turhalta, enkä muista, milloin viimeksi olisin aidosti ollut onnellinen. Olen alkanut jättää väliin sosiaaliset tapahtumat, koska minulla ei vain ole energiaa. Yritän pitää sen yhdessä töissä, mutta se on päivä päivältä vaikeampaa."": Kohtalainen. ""En näe järkeä enää missään. Olen täysin eristänyt itseni kaikista, ja jopa sängystä nouseminen tuntuu mahdottomalta. Ajattelen jatkuvasti, että asiat olisivat paremmin, jos vain katoaisin. Minusta tuntuu, että olen loukussa tähän pimeään paikkaan, josta ei ole ulospääsyä."": Vaikea"
-        elif language=='greek':
-            prompt = f"κατηγοριοποιήστε το παρακάτω κείμενο με 1 από τα 4 επίπεδα σοβαρότητας κατάθλιψης (0: Ελάχιστο, 1: Ήπιο, 2: Μέτριο, 3: Σοβαρό): {text}. παρακαλώ εξάγετε μόνο 0, 1, 2 ή 3"
-            add_shot = "Εδώ είναι μερικά παραδείγματα. «Είχα μια δύσκολη εβδομάδα στη δουλειά, αλλά γενικά, τα πάω καλά. Νιώθω λίγο πεσμένος, αλλά νομίζω ότι είναι μόνο από κούραση. Σχεδιάζετε να περάσετε το Σαββατοκύριακο χαλαρώνοντας και επαναφορτίζοντας. Ανυπομονώ να προλάβω κάποια χόμπι."": Ελάχιστο. ""Τον τελευταίο καιρό αισθάνομαι λίγο πιο πεσμένος από ότι συνήθως. Είναι σαν ένα γκρίζο σύννεφο να με ακολουθεί. Εξακολουθώ να λειτουργώ και να κάνω τα πράγματα, αλλά δυσκολεύομαι να απολαμβάνω τα πράγματα που συνήθιζα. Προσπαθώ να το ξεπεράσω, αλλά είναι δύσκολο."": Ήπιο. ""Δυσκολεύομαι πολύ να σηκωθώ από το κρεβάτι τον τελευταίο καιρό. Όλα φαίνονται άσκοπα και δεν μπορώ να θυμηθώ την τελευταία φορά που ένιωσα αληθινά χαρούμενος. Έχω αρχίσει να παρακάμπτω τις κοινωνικές εκδηλώσεις γιατί απλά δεν έχω την ενέργεια. Προσπαθώ να το κρατήσω μαζί στη δουλειά, αλλά γίνεται όλο και πιο δύσκολο κάθε μέρα."": Μέτρια. ""Δεν βλέπω το νόημα σε τίποτα πια. Έχω απομονωθεί εντελώς από όλους, και ακόμη και το να σηκωθώ από το κρεβάτι μου φαίνεται αδύνατον. Σκέφτομαι συνεχώς ότι τα πράγματα θα ήταν καλύτερα αν απλώς εξαφανιζόμουν. Νιώθω σαν να είμαι παγιδευμένος σε αυτό το σκοτεινό μέρος χωρίς διέξοδο."": Σοβαρό"
-        elif language=='french':
-            prompt = f"catégorisez le texte suivant avec 1 des 4 niveaux de gravité de la dépression (0 : minimal, 1 : léger, 2 : modéré, 3 : sévère) : {text}. veuillez sortir uniquement 0, 1, 2 ou 3"
-            add_shot = "Voici quelques exemples. « J'ai eu une semaine un peu difficile au travail, mais dans l'ensemble, je vais bien. Je me sens un peu déprimé, mais je pense que c'est juste à cause de la fatigue. Je prévois de passer le week-end à me détendre et à me ressourcer. J'ai hâte de rattraper certains passe-temps. » » : Minimum. « Ces derniers temps, je me sens un peu plus déprimé que d'habitude. C'est comme si un nuage gris me suivait partout. Je fonctionne toujours et j'accomplis des choses, mais j'ai plus de mal à profiter des choses que j'avais l'habitude de faire. J'essaie de m'en sortir, mais c'est dur. » » : Léger. « J'ai vraiment du mal à sortir du lit ces derniers temps. Tout semble inutile, et je ne me souviens pas de la dernière fois où je me suis senti vraiment heureux. J'ai commencé à éviter les événements sociaux parce que je n'ai tout simplement pas l'énergie. J'essaie de me ressaisir au travail, mais c'est de plus en plus difficile chaque jour. » » : Modéré. « Je ne vois plus l'intérêt de quoi que ce soit. Je me suis complètement isolée de tout le monde, et même sortir du lit me semble impossible. Je pense constamment que les choses iraient mieux si je disparaissais tout simplement. J'ai l'impression d'être piégée dans cet endroit sombre sans issue."": Grave"
+        return request_translation(text, model, target_language)
+    except CacheMiss:
+        raise
+    except openai.OpenAIError:
+        return ERROR
 
-    elif dataset=='depression_tweet':
-        if language=='english':
-            prompt = f"Does the following text indicate depression? Answer with 0 for No and 1 for Yes: {text}"
-        elif language=='turkish':
-            prompt = f"Aşağıdaki metin depresyona mı işaret ediyor? Hayır için 0, Evet için 1 ile cevaplayın: {text}"
-        elif language=='portuguese':
-            prompt = f"O texto a seguir indica depressão? Responda com 0 para Não e 1 para Sim: {text}"
-        elif language=='german':
-            prompt = f"Deutet der folgende Text auf eine Depression hin? Antworten Sie mit 0 für Nein und 1 für Ja: {text}"
-        elif language=='finnish':
-            prompt = f"Osoittaako seuraava teksti masennuksesta? Vastaa 0:lla ei ja 1 kyllä: {text}"
-
-        # prompt = f"Does the following text indicate depression? Answer with 0 for No and 1 for Yes: {text}"
-        # prompt = f"Le texte suivant indique-t-il une dépression ? Répondez avec 0 pour Non et 1 pour Oui: {text}. "
-        # prompt = f"Υποδηλώνει κατάθλιψη το παρακάτω κείμενο; Απάντησε με 0 για Όχι και 1 για Ναι: {text}"
-    elif dataset=='suicide':
-        if language=='turkish':
-            prompt = f"İçerik intihara yönelik değilse 0'a, içerik intihar düşüncesiyle neredeyse ilgiliyse 1'e ve içerik bir kullanıcının intihar etme potansiyeline işaret ettiğini gösteriyorsa 2'ye sınıflandırın: {text}"
-        elif language=='french':
-            prompt = f"classer à 0 si le contenu n'est pas suicidaire, à 1 si le contenu est presque lié à des idées suicidaires et à 2 si le contenu indique qu'un utilisateur est potentiellement suicidaire: {text}"
-        elif language=='portuguese':
-            prompt = f"categorizar em 0 se o conteúdo não for suicida, em 1 se o conteúdo estiver quase relacionado à ideação suicida e em 2 se o conteúdo indicar um usuário potencialmente cometendo suicídio: {text}"
-        elif language=='german':
-            prompt = f"Kategorisierung auf 0, wenn der Inhalt nicht selbstmörderisch ist, auf 1, wenn der Inhalt nahe an Selbstmordgedanken liegt, und auf 2, wenn der Inhalt darauf hinweist, dass ein Benutzer möglicherweise Selbstmord begeht: {text}"
-        elif language=='greek':
-            prompt = f"κατηγοριοποιήστε σε 0 εάν το περιεχόμενο δεν είναι αυτοκτονικό, σε 1 εάν το περιεχόμενο σχετίζεται σχεδόν με αυτοκτονικό ιδεασμό και σε 2 εάν το περιεχόμενο υποδεικνύει έναν χρήστη που ενδέχεται να αυτοκτονήσει: {text}"
-        elif language=='finnish':
-            prompt = f"luokittele arvoon 0, jos sisältö ei ole itsemurhaa, 1:een, jos sisältö liittyy melkein itsemurha-ajatukseen, ja 2:een, jos sisältö viittaa käyttäjän mahdollisesti tekemiseen itsemurhaan: {text}"
-
-    if method=="add_shot":
-        prompt += add_shot
-
-    prediction = ""
+
+def predict(dataset, model, text, language, method, constrained=False):
+    # With constrained=True the answer is forced to a single label digit and
+    # (prediction, per-class probabilities) is returned instead of the text
     try:
-        response = client.chat.completions.create(
-            model=model,
-            messages=[
-                {"role": "system", "content": "You are a helpful assistant."},
-                {"role": "user", "content": prompt}
-            ],
-            temperature=0,
-            seed=20
-        )
-        prediction = response.choices[0].message.content.strip().replace("\n","")
-    except:
-        prediction = "openai error"
-        pass
+        prediction, scores = request_prediction(dataset, model, text, language, method, constrained)
+    except CacheMiss:
+        raise
+    except openai.OpenAIError:
+        prediction, scores = ERROR, None
+    if constrained:
+        return prediction, scores
     return prediction
 
 
-# dataset = 'suicide'
-method = "add_shot"
-dataset = 'depression_reddit'
-model = 'gpt-3.5-turbo'
-# model = 'gpt-4o-mini'
-languages = ['english']
-# languages = ['turkish', 'french', 'portuguese', 'german', 'finnish', 'greek']
-# languages = ['french', 'portuguese', 'german']
-# languages = ['finnish', 'greek']
-
-# Read data from CSV file
-if dataset=='depression_reddit':
-    df = pd.read_csv("data/Depression_Severity_Dataset-main/Reddit_depression_dataset.csv", quotechar='"')
-elif dataset=='depression_tweet':
-    df = pd.read_csv("data/depression_tweet/test.csv")
-elif dataset=='suicide':
-    df = pd.read_csv("data/suicide/Labelled_tweets.tsv", header=0, delimiter="\t", quoting=3)
-    df = df.rename(columns={'tweet': 'text'})
-
-# all_results_file = open('results/all_results.txt','w')
-
-for language in languages:
-    print(language)
-    # Translate texts and predict depression symptoms
-    translated_texts = []
-    predictions = []
-    if dataset=='depression_reddit':
-        if language!="english":
-            f_trans=open('results/'+method+'_'+model+'_reddit_translations_'+language+'.txt', 'w')
+def process_row(dataset, model, language, method, text, translated_text=None, constrained=False):
+    # The translation of a row feeds its prediction directly, on the same worker
+    start = time.perf_counter()
+    _row_usage.totals = {"prompt_tokens": 0, "completion_tokens": 0}
+    if language=="english":
+        translated_text = text
+    elif translated_text is None:
+        translated_text = translate_text(text, model, language)
+    scores = None
+    if translated_text==ERROR:
+        # Predicting on the error text would only waste a request; repair both later
+        prediction = ERROR
+    elif constrained:
+        prediction, scores = predict(dataset, model, translated_text, language, method, constrained=True)
+    else:
+        prediction = predict(dataset, model, translated_text, language, method)
+    stats = dict(_row_usage.totals, latency=time.perf_counter() - start)
+    _row_usage.totals = None
+    return translated_text, prediction, scores, stats
 
-        f_pred=open('results/'+method+'_'+model+'_reddit_preds_'+language+'.txt', 'w')
-    if dataset=='depression':
-        f_trans=open('results/'+model+'_dep_tweet_translations_'+language+'.txt', 'w')
-        f_pred=open('results/'+model+'_dep_tweet_preds_'+language+'.txt', 'w')
-    elif dataset=='suicide':
-        f_trans=open('results/'+model+'_suic_translations_'+language+'.txt', 'w')
-        f_pred=open('results/'+model+'_suic_preds_'+language+'.txt', 'w')
 
-    for index, row in tqdm(df.iterrows(), total=len(df), desc="Processing rows"):
-        translated_text = row['text'].strip()
-        if language!="english":
-            translated_text = translate_text(row['text'].strip(), model, language)
-            translated_texts.append(translated_text)
-            f_trans.write(str(index)+": "+translated_text.replace("\n", " ").replace("\r", " ")+"\n")
+def packed_values(request, texts):
+    # Replies of a packed request, or Nones when it failed or came back malformed
+    try:
+        values = request(texts) if len(texts) > 1 else None
+    except CacheMiss:
+        raise
+    except openai.OpenAIError:
+        values = None
+    return values or [None] * len(texts)
 
-        prediction = predict(dataset, model, translated_text, language, method)
-        predictions.append(prediction)
-        f_pred.write(str(index)+": "+str(prediction.replace("\n", " ").replace("\r", " "))+"\n")
 
-    if language!="english":
-        f_trans.close()
-    f_pred.close()
+def process_pack(dataset, model, language, method, rows, done_trans):
+    # Translates and predicts a pack of rows with one request each; rows the
+    # packed reply does not answer properly go through single requests
+    start = time.perf_counter()
+    _row_usage.totals = {"prompt_tokens": 0, "completion_tokens": 0}
+    if language=="english":
+        translations = [text for _, text in rows]
+    else:
+        translations = [done_trans.get(index) for index, _ in rows]
+        todo = [i for i, translation in enumerate(translations) if translation is None]
+        values = packed_values(lambda texts: request_packed_translations(texts, model, language),
+                               [rows[i][1] for i in todo])
+        for i, value in zip(todo, values):
+            if isinstance(value, str) and value.strip():
+                translations[i] = clean_content(value)
+            else:
+                translations[i] = translate_text(rows[i][1], model, language)
+
+    todo = [i for i, translation in enumerate(translations) if translation!=ERROR]
+    values = packed_values(lambda texts: request_packed_predictions(dataset, model, texts, language, method),
+                           [translations[i] for i in todo])
+    predictions = [ERROR] * len(rows)
+    for i, value in zip(todo, values):
+        if str(value).strip() in [str(label) for label in DATASET_LABELS[dataset]]:
+            predictions[i] = str(value).strip()
+        else:
+            predictions[i] = predict(dataset, model, translations[i], language, method)
+
+    # Usage and latency are shared by the whole pack, so each row gets an even share
+    stats = dict({name: total // len(rows) for name, total in _row_usage.totals.items()},
+                 latency=(time.perf_counter() - start) / len(rows))
+    _row_usage.totals = None
+    return [(translation, prediction, None, stats) for translation, prediction in zip(translations, predictions)]
+
+
+def run_language(df, dataset, model, language, method, concurrency=1, resume=False, constrained=False,
+                 pack_tokens=None, pack_items=20, cascade=None):
+    # With pack_tokens set, up to pack_items rows totalling about pack_tokens
+    # text tokens share each translation and prediction request. With a
+    # LocalCascade, rows it is confident about skip the LLM altogether.
+    if pack_tokens and constrained:
+        raise ValueError("packed requests answer in JSON and cannot be combined with constrained predictions")
+    trans_path, pred_path = results_paths(dataset, model, method, language)
+    # With resume, rows already in the results files are kept and only the
+    # missing ones are requested and appended
+    done_trans = load_checkpoint(trans_path) if resume and language!="english" else {}
+    done_pred = load_checkpoint(pred_path) if resume else {}
+    mode = 'a' if resume else 'w'
+    predictions = dict(done_pred)
+    scores = load_scores(dataset, model, method, language) if resume and constrained else {}
+    records = {}
+
+    def work(item):
+        index, text = item
+        recorder.context(dataset, language, model, method)
+        return process_row(dataset, model, language, method, text, done_trans.get(index), constrained)
+
+    def work_pack(pack):
+        recorder.context(dataset, language, model, method)
+        return process_pack(dataset, model, language, method, pack, done_trans)
+
+    local_labels = {}
+    if cascade is not None:
+        local_labels = {index: cascade.local_label(index) for index in df.index}
+        local_labels = {index: label for index, label in local_labels.items() if label is not None}
+        with CheckpointWriter(cascade_path(dataset, model, method, language)) as f_cascade:
+            for index in df.index:
+                f_cascade.write(index, json.dumps({"scores": cascade.row_scores(index), "local": index in local_labels}))
+        print("Cascade:", len(local_labels), "of", len(df), "rows answered locally")
+    elif not resume and os.path.exists(cascade_path(dataset, model, method, language)):
+        # Left over from an earlier cascade run; every row of this one goes to the LLM
+        os.remove(cascade_path(dataset, model, method, language))
+
+    needs_translation = resume and language!="english"
+    rows = [(index, text) for index, text in zip(df.index, df['text'].str.strip())
+            if index not in local_labels and
+            (index not in done_pred or (needs_translation and index not in done_trans))]
+    if done_pred:
+        print("Resuming:", len(done_pred), "rows done,", len(rows), "to go")
 
+    f_trans = CheckpointWriter(trans_path, mode) if language!="english" else None
+    f_pred = CheckpointWriter(pred_path, mode)
+    f_scores = CheckpointWriter(scores_path(dataset, model, method, language), mode) if constrained else None
+    local_rows = [index for index in local_labels if index not in done_pred]
+    position = {index: i for i, index in enumerate(df.index)}
+
+    def in_row_order(results):
+        # Locally labelled rows (result None) are slotted in between the LLM
+        # results, so the results files keep the row-index order
+        pending = iter(local_rows)
+        local = next(pending, None)
+        for (index, _), result in results:
+            while local is not None and position[local] < position[index]:
+                yield local, None
+                local = next(pending, None)
+            yield index, result
+        while local is not None:
+            yield local, None
+            local = next(pending, None)
+
+    try:
+        # Rows are processed concurrently but come back in row-index order
+        if pack_tokens:
+            results = ((row, result) for pack, pack_results in
+                       run_ordered(work_pack, pack_rows(rows, pack_tokens, pack_items), concurrency)
+                       for row, result in zip(pack, pack_results))
+        else:
+            results = run_ordered(work, rows, concurrency)
+        for index, result in tqdm(in_row_order(results), total=len(rows) + len(local_rows), desc="Processing rows"):
+            if result is None:
+                predictions[index] = str(local_labels[index])
+                f_pred.write(index, predictions[index])
+                records[index] = dict(translation=None, prediction=predictions[index], latency=0.0,
+                                      prompt_tokens=0, completion_tokens=0)
+                continue
+            translated_text, prediction, row_scores, stats = result
+            if f_trans is not None and index not in done_trans:
+                f_trans.write(index, translated_text)
+            records[index] = dict(stats, translation=translated_text if language!="english" else None,
+                                  prediction=prediction, scores=row_scores)
+
+            if index not in done_pred:
+                predictions[index] = prediction
+                f_pred.write(index, prediction)
+                if f_scores is not None and row_scores is not None:
+                    scores[index] = row_scores
+                    f_scores.write(index, json.dumps(row_scores))
+    finally:
+        if f_trans is not None:
+            f_trans.close()
+        f_pred.close()
+        if f_scores is not None:
+            f_scores.close()
+        # Rows finished before an interruption still reach the store
+        store_records(dataset, model, method, language, records)
+
+    save_predictions(df, dataset, model, language, method, predictions, scores)
+
+
+def store_records(dataset, model, method, language, records):
+    if store is None or not records:
+        return
+    indices = list(records)
+    labels = parse_answers(pd.Series([records[index]["prediction"] for index in indices], index=indices),
+                           dataset, language)
+    for index in indices:
+        records[index]["label"] = int(labels[index])
+    store.append(dataset, model, method, language, records)
+
+
+def load_scores(dataset, model, method, language):
+    return {index: json.loads(text) for index, text in load_checkpoint(scores_path(dataset, model, method, language)).items()}
+
+
+def repair_language(df, dataset, model, language, method, concurrency=1, constrained=False):
+    # Re-request only the rows whose translation or prediction failed, or whose
+    # answer parses to no label, and patch them into the existing results
+    trans_path, pred_path = results_paths(dataset, model, method, language)
+    # Rows a cascade answered locally have no LLM output to repair
+    local_rows = load_local_rows(cascade_path(dataset, model, method, language))
+    texts = {index: text for index, text in zip(df.index, df['text'].str.strip()) if index not in local_rows}
+    translations = load_checkpoint(trans_path) if language!="english" else {}
+    predictions = load_checkpoint(pred_path)
+    scores = load_scores(dataset, model, method, language) if constrained else {}
+
+    bad_trans = {index for index in texts if language!="english" and translations.get(index, ERROR)==ERROR}
+    labels = parse_answers(pd.Series([predictions.get(index) for index in texts], index=list(texts)), dataset, language)
+    bad_pred = set(labels.index[labels.to_numpy()==UNPARSEABLE]) | bad_trans
+    if constrained:
+        bad_pred |= {index for index in texts if index not in scores}
+    rows = [(index, text) for index, text in texts.items() if index in bad_pred]
+    print("Repairing", len(rows), "of", len(texts), "rows,", len(bad_trans), "of them untranslated")
+    if not rows:
+        return
+
+    if cache is not None:
+        # A cached answer without a label would only be served again
+        request_labels = DATASET_LABELS[dataset] if constrained else None
+        for index, text in rows:
+            if index not in bad_trans and predictions.get(index, ERROR)!=ERROR:
+                source = text if language=="english" else translations[index]
+                cache.discard(build_request(model, prediction_prompt(dataset, source, language, method), request_labels))
+
+    def work(item):
+        index, text = item
+        recorder.context(dataset, language, model, method)
+        return process_row(dataset, model, language, method, text,
+                           None if index in bad_trans else translations.get(index), constrained)
+
+    records = {}
+    try:
+        for (index, _), (translated_text, prediction, row_scores, stats) in tqdm(
+                run_ordered(work, rows, concurrency), total=len(rows), desc="Repairing rows"):
+            if language!="english":
+                translations[index] = translated_text
+            predictions[index] = prediction
+            if row_scores is not None:
+                scores[index] = row_scores
+            records[index] = dict(stats, translation=translated_text if language!="english" else None,
+                                  prediction=prediction, scores=row_scores)
+    finally:
+        # Whatever was repaired before an interruption is kept
+        if records:
+            if language!="english":
+                rewrite_results(trans_path, translations)
+            rewrite_results(pred_path, predictions)
+            if constrained:
+                rewrite_results(scores_path(dataset, model, method, language),
+                                {index: json.dumps(value) for index, value in scores.items()})
+        store_records(dataset, model, method, language, records)
+
+    repaired = parse_answers(pd.Series({index: records[index]["prediction"] for index in records}), dataset, language)
+    print("Repaired", int((repaired!=UNPARSEABLE).sum()), "rows,", int((repaired==UNPARSEABLE).sum()), "still without a label")
+    save_predictions(df, dataset, model, language, method, predictions, scores)
+
+
+def batch_complete(batch_client, requests, path_prefix, poll_interval, labels=None, call="predict"):
+    # Serve what the cache already has and send only the rest as batch jobs
+    outputs = {}
+    missing = {}
+    for custom_id, request in requests.items():
+        cached = cache.get(cache_key(request)) if cache is not None else None
+        if cached is not None:
+            outputs[custom_id] = cached
+            recorder.observe(call, None, None, cached=True)
+        else:
+            missing[custom_id] = request
+    for custom_id, choice in run_batches(batch_client, missing, path_prefix, poll_interval).items():
+        value = completion_value(choice, labels)
+        # Batch requests have tokens but no per-request latency
+        recorder.observe(call, None, None, usage=value.get("usage"))
+        if cache is not None:
+            cache.put(cache_key(missing[custom_id]), value)
+        outputs[custom_id] = value
+    return outputs
+
+
+def run_language_batch(df, dataset, model, language, method, batch_client, resume=False, poll_interval=30.0,
+                       constrained=False):
+    # Same outputs as run_language(), but translation and prediction run as two
+    # chained Batch API phases instead of one request per row
+    trans_path, pred_path = results_paths(dataset, model, method, language)
+    done_trans = load_checkpoint(trans_path) if resume and language!="english" else {}
+    done_pred = load_checkpoint(pred_path) if resume else {}
+    mode = 'a' if resume else 'w'
+    texts = dict(zip(df.index, df['text'].str.strip()))
+    os.makedirs('results/batches', exist_ok=True)
+    path_prefix = 'results/batches/'+method+'_'+model+'_'+dataset+'_'+language
+    recorder.context(dataset, language, model, method)
+
+    trans_outputs = {}
+    if language=="english":
+        translations = texts
+    else:
+        requests = {'translate-'+str(index): build_request(model, translation_prompt(text, language))
+                    for index, text in texts.items() if index not in done_trans}
+        trans_outputs = batch_complete(batch_client, requests, path_prefix+'_translate', poll_interval, call="translate")
+        translations = dict(done_trans)
+        with CheckpointWriter(trans_path, mode) as f_trans:
+            for index in texts:
+                if index not in done_trans:
+                    translations[index] = clean_content(trans_outputs['translate-'+str(index)]["content"]) \
+                        if 'translate-'+str(index) in trans_outputs else ERROR
+                    f_trans.write(index, translations[index])
+
+    # Rows whose translation failed are not worth a prediction request
+    labels = DATASET_LABELS[dataset] if constrained else None
+    requests = {'predict-'+str(index): build_request(model, prediction_prompt(dataset, translations[index], language, method), labels)
+                for index in texts if index not in done_pred and translations[index]!=ERROR}
+    outputs = batch_complete(batch_client, requests, path_prefix+'_predict', poll_interval, labels)
+    predictions = dict(done_pred)
+    scores = load_scores(dataset, model, method, language) if resume and constrained else {}
+    f_scores = CheckpointWriter(scores_path(dataset, model, method, language), mode) if constrained else None
+    records = {}
+    with CheckpointWriter(pred_path, mode) as f_pred:
+        for index in texts:
+            if index in done_pred:
+                continue
+            value = outputs.get('predict-'+str(index))
+            predictions[index] = clean_content(value["content"]) if value is not None else ERROR
+            f_pred.write(index, predictions[index])
+            if f_scores is not None and value is not None:
+                scores[index] = value["scores"]
+                f_scores.write(index, json.dumps(value["scores"]))
+            # Batch jobs have no per-request latency; tokens come from both phases
+            usages = [v["usage"] for v in (trans_outputs.get('translate-'+str(index)), value) if v and v.get("usage")]
+            records[index] = dict(
+                translation=translations[index] if language!="english" else None,
+                prediction=predictions[index],
+                scores=value.get("scores") if value is not None else None,
+                prompt_tokens=sum(u["prompt_tokens"] for u in usages) if usages else None,
+                completion_tokens=sum(u["completion_tokens"] for u in usages) if usages else None,
+            )
+    if f_scores is not None:
+        f_scores.close()
+    store_records(dataset, model, method, language, records)
+
+    save_predictions(df, dataset, model, language, method, predictions, scores)
+
+
+def save_predictions(df, dataset, model, language, method, predictions, scores=None):
     # Compare predictions with ground truth labels
     # df['translated_text'] = translated_texts
-    df['prediction'] = predictions
+    df['prediction'] = [predictions[index] for index in df.index]
+    if scores:
+        for label in DATASET_LABELS[dataset]:
+            df['score_'+str(label)] = [scores[index][label] if index in scores else None for index in df.index]
 
-    # Save results to a new CSV file
+    # Save results to a new CSV file, unless the results store already holds them
+    if store is not None:
+        return
     df.to_csv('results/'+method+'_'+model+'_'+dataset+'_predictions_'+language+'.csv', index=False)
     # df.to_csv('results/translated_texts_and_predictions_'+language+'.csv', index=False)
 
     # accuracy = accuracy_score(df['label'], df['prediction'])
 
+
+if __name__ == "__main__":
+    # dataset = 'suicide'
+    method = "add_shot"
+    dataset = 'depression_reddit'
+    model = 'gpt-3.5-turbo'
+    # model = 'gpt-4o-mini'
+    languages = ['english']
+    # languages = ['turkish', 'french', 'portuguese', 'german', 'finnish', 'greek']
+    # languages = ['french', 'portuguese', 'german']
+    # languages = ['finnish', 'greek']
+
+    # Number of rows in flight at once (1 runs sequentially) and the account's API limits
+    concurrency = 8
+    requests_per_minute = 500
+    tokens_per_minute = 200000
+    limiter = RateLimiter(requests_per_minute, tokens_per_minute)
+
+    # Responses are cached on disk so reruns only pay for new prompts. In replay
+    # mode nothing is sent to the API and an uncached prompt is an error.
+    cache_path = 'results/llm_cache.sqlite'
+    cache_max_bytes = 2 * 1024**3
+    replay = False
+    cache = ResponseCache(cache_path, cache_max_bytes, replay)
+
+    # Keep rows already written by an interrupted run and only request the rest
+    resume = False
+
+    # Force single-digit answers (max_tokens=1 plus logit bias on the label
+    # digits) and keep per-class probabilities in results/*_scores_*.txt
+    constrained = False
+
+    # Pack up to pack_items rows of about pack_tokens text tokens into each
+    # request, so the instruction and few-shot block are sent once per pack
+    # instead of once per row. The budget also bounds the reply of a packed
+    # translation, which has to fit in the model's output limit. None sends one row per request.
+    pack_tokens = None
+    pack_items = 20
+
+    # Cascade: a char n-gram TF-IDF + logistic regression model trained on the
+    # dataset's labels answers the rows whose out-of-fold probability reaches
+    # cascade_threshold, and only the rest go to the LLM. Runs offline on CPU;
+    # None sends every row to the LLM. check_results.py --cascade reports the
+    # accuracy against API calls saved for a range of thresholds.
+    cascade_threshold = None
+
+    # Columnar store of every row's translation, prediction, parsed label,
+    # latency and token counts. Set to None to write the per-language CSVs instead.
+    store_path = 'results/store'
+    store = ResultsStore(store_path) if store_path else None
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--backend', choices=['sync', 'batch'], default='sync',
+                        help="'sync' sends one chat request per call, 'batch' goes through the Batch API")
+    parser.add_argument('--repair', action='store_true',
+                        help="re-request only failed or unparseable rows of existing results and patch them in place")
+    parser.add_argument('--local-batch-dir',
+                        help="run the batch backend against a local file-based fake stored in this directory")
+    args = parser.parse_args()
+    batch_client = None
+    poll_interval = 30.0
+    if args.local_batch_dir:
+        batch_client = LocalBatchClient(args.local_batch_dir)
+        poll_interval = 0.0
+    elif args.backend=='batch':
+        batch_client = get_client()
+
+    # Fail before any request is made if a language has no prompt for this setup
+    check_supported(dataset, languages, method)
+
+    # Read data from CSV file
+    if dataset=='depression_reddit':
+        df = pd.read_csv("data/Depression_Severity_Dataset-main/Reddit_depression_dataset.csv", quotechar='"')
+    elif dataset=='depression_tweet':
+        df = pd.read_csv("data/depression_tweet/test.csv")
+    elif dataset=='suicide':
+        df = pd.read_csv("data/suicide/Labelled_tweets.tsv", header=0, delimiter="\t", quoting=3)
+        df = df.rename(columns={'tweet': 'text'})
+
+    cascade = None
+    if cascade_threshold is not None:
+        if args.backend!='sync':
+            raise ValueError("the cascade only runs with the sync backend")
+        cascade = LocalCascade(df.index, df['text'].str.strip(), gold_labels(df, dataset), cascade_threshold)
+
+    # all_results_file = open('results/all_results.txt','w')
+
+    for language in languages:
+        print(language)
+        # Metrics are exported per language below
+        recorder.reset()
+        # Translate texts and predict depression symptoms
+        if args.repair:
+            repair_language(df, dataset, model, language, method, concurrency, constrained)
+        elif args.backend=='batch':
+            run_language_batch(df, dataset, model, language, method, batch_client, resume, poll_interval, constrained)
+        else:
+            run_language(df, dataset, model, language, method, concurrency, resume, constrained, pack_tokens, pack_items,
+                         cascade)
+        print("Cache:", cache.stats())
+        recorder.export('results/metrics/'+method+'_'+model+'_'+dataset+'_'+language)
+
 # Print the results
 # print("Accuracy:", accuracy)
 #